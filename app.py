@@ -1,127 +1,1068 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, session, flash
+from flask import Flask, Response, jsonify, render_template, request, redirect, url_for, session, flash, g, has_app_context
+from flask import before_render_template, template_rendered
 import sqlite3
+import click
 import json
+import bisect
 import csv
+import hashlib
+import heapq
+import importlib.util
 import io
 import os
-from datetime import datetime
+import re
+import queue
+import threading
+import uuid
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from itertools import islice
 from dotenv import load_dotenv
+from markupsafe import Markup, escape
 import random
 import string
+import sys
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
 # @app.route("/lead-dashboard")
 # def lead_dashboard():
 #     return home()
 
-def ensure_column_exists(table_name, column_name, column_type):
-    """Check if a column exists, and add it if missing."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = [info[1] for info in cursor.fetchall()]
-    if column_name not in columns:
-        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
-        conn.commit()
-    conn.close()
-# Optional Gemini import (if available)
+# Optional Gemini SDK. It pulls in gRPC/protobuf, so only its presence is
+# checked here; GeminiClient imports it on the first AI call.
 try:
-    import google.generativeai as genai
-    GENAI = True
-except Exception:
+    GENAI = importlib.util.find_spec("google.generativeai") is not None
+except ImportError:
     GENAI = False
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET", "task_manager_secret")
-DB_PATH = "inter_team_task.db"
+DB_PATH = os.getenv("DATABASE_URL", "inter_team_task.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_KB = int(os.getenv("DB_CACHE_KB", "65536"))
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "models/gemini-2.5-flash")
+
+
+# ---------------- Instrumentation ----------------
+# Per-process metrics in Prometheus text format on /metrics. With several
+# workers each reports its own numbers; scrape them per process.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))  # 0 disables the slow-request log
+SLOW_LOG_MAX_QUERIES = 100
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Thread-safe Prometheus histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+        for label_values, counts, count, total in sorted(items):
+            labels = _prom_labels(self.labels, label_values)
+            running = 0
+            for bound, n in zip(self.buckets, counts):
+                running += n
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {running}')
+            lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+class Counter:
+    """Thread-safe Prometheus counter keyed by a tuple of label values."""
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{{{_prom_labels(self.labels, label_values)}}} {value}")
+        return lines
+
+
+def _prom_labels(names, values):
+    def escape_value(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{n}="{escape_value(v)}"' for n, v in zip(names, values))
+
+
+REQUEST_LATENCY = Histogram("taskify_request_duration_seconds",
+                            "Time from request start to response headers, per endpoint.", ("endpoint", "method"))
+REQUESTS = Counter("taskify_requests_total", "Requests by endpoint and status code.", ("endpoint", "method", "status"))
+SQL_QUERY_LATENCY = Histogram("taskify_sql_query_duration_seconds", "Time spent in one SQLite execute call.")
+SQL_QUERIES = Counter("taskify_sql_queries_total", "SQLite statements executed, per endpoint.", ("endpoint",))
+SQL_SECONDS = Counter("taskify_sql_seconds_total", "Time spent in SQLite execute calls, per endpoint.",
+                      ("endpoint",))
+TEMPLATE_LATENCY = Histogram("taskify_template_render_seconds", "Jinja template render time.", ("template",))
+AI_LATENCY = Histogram("taskify_ai_request_duration_seconds", "Gemini call latency by outcome.", ("outcome",))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times every execute and charges it to the current request.
+
+    Only the execute call is timed (for a SELECT that is the time to its
+    first row); fetching the remaining rows is not.
+    """
+
+    def _timed(self, method, sql, params):
+        start = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            elapsed = time.perf_counter() - start
+            SQL_QUERY_LATENCY.observe(elapsed)
+            stats = g.get("sql") if has_app_context() else None
+            if stats is not None:
+                stats["count"] += 1
+                stats["seconds"] += elapsed
+                if SLOW_REQUEST_MS and len(stats["queries"]) < SLOW_LOG_MAX_QUERIES:
+                    stats["queries"].append((elapsed, " ".join(sql.split())[:300]))
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    # sqlite3.Connection.execute does not go through cursor(), so route it here
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+if METRICS_ENABLED:
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.sql = {"count": 0, "seconds": 0.0, "queries": []}
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get("request_started")
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or "unmatched"
+        REQUEST_LATENCY.observe(elapsed, endpoint, request.method)
+        REQUESTS.inc(1, endpoint, request.method, response.status_code)
+        sql = g.sql
+        SQL_QUERIES.inc(sql["count"], endpoint)
+        SQL_SECONDS.inc(sql["seconds"], endpoint)
+        if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+            app.logger.warning(
+                "slow request %s %s -> %s in %.1f ms; %d queries took %.2f ms%s",
+                request.method, request.full_path, response.status_code, elapsed * 1000,
+                sql["count"], sql["seconds"] * 1000,
+                "".join(f"\n  {q_elapsed * 1000:8.2f} ms  {q_sql}" for q_elapsed, q_sql in sql["queries"]))
+        return response
+
+    @before_render_template.connect_via(app)
+    def _template_started(sender, template, context, **extra):
+        g.setdefault("template_started", []).append(time.perf_counter())
+
+    @template_rendered.connect_via(app)
+    def _template_finished(sender, template, context, **extra):
+        starts = g.get("template_started")
+        if starts:
+            TEMPLATE_LATENCY.observe(time.perf_counter() - starts.pop(), template.name or "string")
+
+
+def _gauge(name, doc, value):
+    return [f"# HELP {name} {doc}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+
+@app.route("/metrics")
+def metrics():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return Response("unauthorized\n", status=401, mimetype="text/plain")
+    lines = []
+    for metric in (REQUEST_LATENCY, REQUESTS, SQL_QUERY_LATENCY, SQL_QUERIES, SQL_SECONDS, TEMPLATE_LATENCY,
+                   AI_LATENCY):
+        lines += metric.render()
+    ai = ai_client.snapshot()
+    lines += _gauge("taskify_ai_breaker_open", "1 while the Gemini circuit breaker is open.",
+                    int(ai["breaker"] == "open"))
+    for key in ("coalesced", "short_circuited"):
+        lines += [f"# TYPE taskify_ai_{key}_total counter", f"taskify_ai_{key}_total {ai[key]}"]
+    lines += ["# TYPE taskify_ai_cache_total counter"]
+    lines += [f'taskify_ai_cache_total{{result="{k}"}} {v}' for k, v in sorted(ai_cache.stats.items())]
+    lines += ["# TYPE taskify_fragment_cache_total counter"]
+    lines += [f'taskify_fragment_cache_total{{result="{k}"}} {v}' for k, v in sorted(fragment_cache.stats.items())]
+    lines += _gauge("taskify_fragment_cache_bytes", "Bytes of rendered pages held in the fragment cache.",
+                    fragment_cache.bytes)
+    lines += WRITE_BATCH_SIZE.render()
+    lines += _gauge("taskify_write_queue_depth", "Write intents waiting for the group-commit writer.",
+                    write_queue.depth())
+    if task_snapshots is not None:
+        lines += ["# TYPE taskify_task_snapshots_total counter"]
+        lines += [f'taskify_task_snapshots_total{{result="{k}"}} {v}' for k, v in sorted(task_snapshots.stats.items())]
+        lines += _gauge("taskify_task_snapshot_bytes", "Estimated bytes of team task snapshots.", task_snapshots.bytes)
+    lines += _gauge("taskify_db_pool_idle", "Idle pooled SQLite connections.", db_pool._idle.qsize())
+    lines += _gauge("taskify_event_streams", "Open /events streams.", events.snapshot()["streams"])
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
 
 
 # ---------------- Utility DB helpers ----------------
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+class ConnectionPool:
+    """Small LIFO pool of SQLite connections shared by all request threads.
+
+    Connections are opened lazily, configured once (WAL, synchronous=NORMAL,
+    busy timeout, page cache) and handed back after every request, so the
+    per-connection prepared statement cache survives between requests.
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=256,
+            factory=InstrumentedConnection if METRICS_ENABLED else sqlite3.Connection,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _check_fork(self):
+        # connections must never cross a fork (e.g. gunicorn workers)
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._idle = queue.LifoQueue(maxsize=self.size)
+                    self._pid = os.getpid()
+
+    def acquire(self):
+        self._check_fork()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        if self._pid != os.getpid():
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        if self.closed:
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+db_pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
 
 
-def ensure_column_exists(table, column, definition):
+def get_db():
+    """Return the connection bound to the current request.
+
+    The first call in a request checks a connection out of ``db_pool``; later
+    calls (``current_user()``, the route itself) reuse it. It is handed back
+    to the pool in ``release_db`` when the app context tears down, so routes
+    must not close it themselves.
+    """
+    if not has_app_context():
+        raise RuntimeError("get_db() needs an app context; use db_pool.acquire() instead")
+    if "db" not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    for pool, conn in g.pop("team_dbs", {}).values():
+        pool.release(conn)
+    conn = g.pop("db", None)
+    if conn is not None:
+        db_pool.release(conn)
+
+
+def ensure_column_exists(conn, table, column, definition):
     """Add column if not exists (simple handler)."""
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(f"PRAGMA table_info({table})")
-    cols = [r[1] for r in cur.fetchall()]
+    cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
     if column not in cols:
-        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
-        conn.commit()
-    conn.close()
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+# ---------------- Per-team shards (optional) ----------------
+# With SHARD_DIR set, each team's tasks and submissions live in
+# SHARD_DIR/team-<id>.db and DATABASE_URL is the catalog (see the README).
+SHARD_DIR = os.getenv("SHARD_DIR")
+SHARD_MAX_OPEN = int(os.getenv("SHARD_MAX_OPEN", "64"))
+SHARD_POOL_SIZE = int(os.getenv("SHARD_POOL_SIZE", "4"))
+SHARD_ID_BITS = 32
+
+
+class ShardRouter:
+    """Maps team ids to shard files; an LRU of open pools, each migrated when first opened."""
+
+    def __init__(self, directory, max_open, pool_size):
+        self.directory = directory
+        self.max_open = max_open
+        self.pool_size = pool_size
+        self._pools = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, team_id):
+        return os.path.join(self.directory, f"team-{int(team_id)}.db")
+
+    def team_ids(self):
+        """Teams that have a shard file on disk."""
+        names = (re.fullmatch(r"team-(\d+)\.db", n) for n in os.listdir(self.directory))
+        return sorted(int(m.group(1)) for m in names if m)
+
+    def pool(self, team_id):
+        with self._lock:
+            pool = self._pools.get(team_id)
+            if pool is not None:
+                self._pools.move_to_end(team_id)
+                return pool
+        pool = ConnectionPool(self.path(team_id), self.pool_size)
+        conn = pool.acquire()
+        try:
+            run_migrations(conn)
+            init_shard(conn, team_id)
+        finally:
+            pool.release(conn)
+        with self._lock:
+            if team_id in self._pools:
+                # another thread opened it meanwhile; use theirs
+                pool.closed = True
+                pool.close_all()
+                return self._pools[team_id]
+            self._pools[team_id] = pool
+            while len(self._pools) > self.max_open:
+                _, evicted = self._pools.popitem(last=False)
+                evicted.closed = True
+                evicted.close_all()
+        return pool
+
+    def open_count(self):
+        with self._lock:
+            return len(self._pools)
+
+
+def init_shard(conn, team_id):
+    """Start a shard's AUTOINCREMENT ids at ``team_id << SHARD_ID_BITS`` (no-op once past it)."""
+    base = int(team_id) << SHARD_ID_BITS
+    for table in ("tasks", "submissions"):
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (table,)).fetchone()
+        if row is None:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, base))
+        elif row[0] < base:
+            conn.execute("UPDATE sqlite_sequence SET seq=? WHERE name=?", (base, table))
+    conn.commit()
 
 
-# ---------------- DB INIT / MIGRATION ----------------
-def init_db():
-    conn = get_db()
-    cur = conn.cursor()
-
-    # tasks table (if doesn't exist) - ensure team_id column exists
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS tasks (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        task TEXT,
-        assigned_to TEXT,
-        priority TEXT,
-        status TEXT,
-        created_at TEXT,
-        sub_tasks TEXT,
-        explanation TEXT,
-        team_id INTEGER
-    );
-    """)
+shards = ShardRouter(SHARD_DIR, SHARD_MAX_OPEN, SHARD_POOL_SIZE) if SHARD_DIR else None
 
-    # users table
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT,
-        display_name TEXT,
-        password TEXT,
-        role TEXT,
-        team_id INTEGER,
-        member_code TEXT
-    );
-    """)
 
-    # teams table
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS teams (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        team_code TEXT,
-        lead_id INTEGER,
-        member_count INTEGER
-    );
-    """)
+def team_pool(team_id):
+    """The pool holding ``team_id``'s tasks: its shard, or db_pool without sharding."""
+    if shards is None or team_id is None:
+        return db_pool
+    return shards.pool(team_id)
 
-    # submissions table
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS submissions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        task_id INTEGER,
-        member_id INTEGER,
-        github_link TEXT,
-        submitted_on TEXT
-    );
-    """)
 
-    conn.commit()
-    conn.close()
+def get_team_db(team_id):
+    """Request-bound connection for ``team_id``'s tasks and submissions.
+
+    Same lifetime rules as get_db(); without sharding (or without a team) it
+    *is* get_db(). Users, teams and member codes are always read through
+    get_db().
+    """
+    pool = team_pool(team_id)
+    if pool is db_pool:
+        return get_db()
+    team_dbs = g.setdefault("team_dbs", {})
+    if team_id not in team_dbs:
+        team_dbs[team_id] = (pool, pool.acquire())
+    return team_dbs[team_id][1]
+
 
+def database_pools():
+    """db_pool followed by the pool of every shard on disk."""
+    yield db_pool
+    if shards is not None:
+        for team_id in shards.team_ids():
+            yield shards.pool(team_id)
 
-# initialize DB (creates tables if missing)
-if not os.path.exists(DB_PATH):
-    init_db()
-else:
-    # ensure team_id column exists in tasks if DB older
-    ensure_column_exists("tasks", "team_id", "INTEGER")
+
+def _columns(conn, table):
+    return ", ".join(r[1] for r in conn.execute(f"PRAGMA main.table_info({table})"))
+
+
+def split_team(team_id):
+    """Copy one team's rows from the catalog into its shard; returns (tasks, submissions) copied.
+
+    Idempotent (rows already in the shard are skipped), so an interrupted
+    split can simply be re-run. Triggers in the shard rebuild its
+    team_stats, search index and team version as the rows go in.
+    """
+    pool = shards.pool(team_id)
+    conn = pool.acquire()
+    try:
+        conn.execute("ATTACH DATABASE ? AS source", (DB_PATH,))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            team_tasks = "SELECT id FROM source.tasks WHERE team_id=?"
+            cols = _columns(conn, "tasks")
+            tasks = conn.execute(f"INSERT OR IGNORE INTO main.tasks ({cols}) SELECT {cols} FROM source.tasks "
+                                 f"WHERE team_id=?", (team_id,)).rowcount
+            cols = _columns(conn, "submissions")
+            submissions = conn.execute(f"INSERT OR IGNORE INTO main.submissions ({cols}) SELECT {cols} "
+                                       f"FROM source.submissions WHERE task_id IN ({team_tasks})", (team_id,)).rowcount
+            cols = _columns(conn, "ai_cache")
+            conn.execute(f"INSERT OR IGNORE INTO main.ai_cache ({cols}) SELECT {cols} FROM source.ai_cache "
+                         f"WHERE task_id IN ({team_tasks})", (team_id,))
+            cols = _columns(conn, "tasks_archive")
+            conn.execute(f"INSERT OR IGNORE INTO main.tasks_archive ({cols}) SELECT {cols} FROM source.tasks_archive "
+                         f"WHERE team_id=?", (team_id,))
+            cols = _columns(conn, "submissions_archive")
+            conn.execute(f"INSERT OR IGNORE INTO main.submissions_archive ({cols}) SELECT {cols} "
+                         f"FROM source.submissions_archive WHERE task_id IN "
+                         f"(SELECT id FROM source.tasks_archive WHERE team_id=?)", (team_id,))
+            refresh_task_risk(conn, team_id=team_id)
+            conn.commit()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute("DETACH DATABASE source")
+    finally:
+        pool.release(conn)
+    return tasks, submissions
+
+
+def drop_split_rows(conn, team_ids):
+    """Delete split teams' rows from the catalog, in one transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for team_id in team_ids:
+            team_tasks = "SELECT id FROM tasks WHERE team_id=?"
+            conn.execute(f"DELETE FROM submissions WHERE task_id IN ({team_tasks})", (team_id,))
+            conn.execute(f"DELETE FROM ai_cache WHERE task_id IN ({team_tasks})", (team_id,))
+            conn.execute("DELETE FROM task_risk WHERE team_id=?", (team_id,))
+            conn.execute("DELETE FROM tasks WHERE team_id=?", (team_id,))
+            conn.execute("DELETE FROM submissions_archive WHERE task_id IN "
+                         "(SELECT id FROM tasks_archive WHERE team_id=?)", (team_id,))
+            conn.execute("DELETE FROM tasks_archive WHERE team_id=?", (team_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+@app.cli.command("split-shards")
+@click.option("--keep-source", is_flag=True, help="leave the copied rows in the catalog database too")
+def split_shards_command(keep_source):
+    """Move every team's tasks and submissions from DATABASE_URL into SHARD_DIR."""
+    if shards is None:
+        raise click.ClickException("set SHARD_DIR to the directory the team shards should go to")
+    ensure_schema()
+    conn = db_pool.acquire()
+    try:
+        team_ids = [r[0] for r in conn.execute("SELECT id FROM teams ORDER BY id")]
+        for team_id in team_ids:
+            tasks, submissions = split_team(team_id)
+            click.echo(f"team {team_id}: {tasks} tasks, {submissions} submissions -> {shards.path(team_id)}")
+        if not keep_source:
+            drop_split_rows(conn, team_ids)
+        orphans = conn.execute("SELECT COUNT(*) FROM tasks WHERE team_id IS NULL").fetchone()[0]
+    finally:
+        db_pool.release(conn)
+    if orphans:
+        click.echo(f"{orphans} tasks without a team stay in {DB_PATH}")
+    click.echo("done; run VACUUM on the catalog to return the freed space" if not keep_source else "done")
+
+
+# ---------------- Group-commit writer (optional) ----------------
+# WRITE_QUEUE=1 commits the hot write routes' writes in batches on one writer
+# thread per process (see "Group-commit writer" in the README).
+WRITE_QUEUE_ENABLED = os.getenv("WRITE_QUEUE", "0") == "1"
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "64"))
+WRITE_BATCH_WAIT_MS = float(os.getenv("WRITE_BATCH_WAIT_MS", "2"))
+WRITE_QUEUE_LIMIT = int(os.getenv("WRITE_QUEUE_LIMIT", "1024"))
+WRITE_TIMEOUT = float(os.getenv("WRITE_TIMEOUT", "10"))
+
+WRITE_BATCH_SIZE = Histogram("taskify_write_batch_size", "Write intents committed per group commit.",
+                             buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+
+class WriteQueue:
+    """Writer thread that group-commits ``fn(conn, *args)`` intents; ``submit`` returns a Future."""
+
+    def __init__(self, max_batch, max_wait, limit):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.limit = limit
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # the writer thread does not survive a fork; start one per process
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self.limit)
+                    threading.Thread(target=self._run, args=(self._queue,), name="db-writer", daemon=True).start()
+                    self._pid = os.getpid()
+
+    def submit(self, fn, *args):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((fn, args, future), timeout=WRITE_TIMEOUT)
+        return future
+
+    def depth(self):
+        return self._queue.qsize() if self._pid == os.getpid() else 0
+
+    def _next_batch(self, intents):
+        batch = [intents.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(intents.get(timeout=remaining) if remaining > 0 else intents.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, intents):
+        conn = db_pool.acquire()
+        while True:
+            batch = self._next_batch(intents)
+            outcomes = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for fn, args, future in batch:
+                    conn.execute("SAVEPOINT intent")
+                    try:
+                        outcomes.append((future, fn(conn, *args), None))
+                        conn.execute("RELEASE intent")
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO intent")
+                        conn.execute("RELEASE intent")
+                        outcomes.append((future, None, e))
+                conn.commit()
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                app.logger.warning("group commit of %d writes failed: %s", len(batch), e)
+                outcomes = [(future, None, e) for _, _, future in batch]
+            WRITE_BATCH_SIZE.observe(len(batch))
+            for future, result, error in outcomes:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+
+write_queue = WriteQueue(WRITE_BATCH_MAX, WRITE_BATCH_WAIT_MS / 1000, WRITE_QUEUE_LIMIT)
+
+
+def run_write(team_id, fn, *args):
+    """Run ``fn(conn, *args)`` on ``team_id``'s data as one committed write and return its result.
+
+    ``fn`` must not commit; it goes through write_queue when WRITE_QUEUE=1 and unsharded.
+    """
+    if WRITE_QUEUE_ENABLED and shards is None:
+        return write_queue.submit(fn, *args).result(timeout=WRITE_TIMEOUT)
+    conn = get_team_db(team_id)
+    try:
+        result = fn(conn, *args)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return result
+
+
+# ---------------- DB INIT / MIGRATION ----------------
+def _create_unique_index(name, table, column):
+    """Migration step: unique index, or a plain one if old rows already collide."""
+    def step(conn):
+        dup = conn.execute(
+            f"SELECT {column} FROM {table} WHERE {column} IS NOT NULL "
+            f"GROUP BY {column} HAVING COUNT(*) > 1 LIMIT 1"
+        ).fetchone()
+        if dup:
+            app.logger.warning("%s.%s has duplicate value %r; creating non-unique index %s",
+                               table, column, dup[0], name)
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({column})")
+        else:
+            conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table}({column})")
+    return step
+
+
+# Ordered (version, description, steps). A step is either a SQL string or a
+# callable taking the connection. Never edit a released migration - append.
+MIGRATIONS = [
+    (1, "base tables", [
+        """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task TEXT,
+            assigned_to TEXT,
+            priority TEXT,
+            status TEXT,
+            created_at TEXT,
+            sub_tasks TEXT,
+            explanation TEXT,
+            team_id INTEGER
+        )
+        """,
+        # databases created before teams existed lack tasks.team_id
+        lambda conn: ensure_column_exists(conn, "tasks", "team_id", "INTEGER"),
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT,
+            display_name TEXT,
+            password TEXT,
+            role TEXT,
+            team_id INTEGER,
+            member_code TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS teams (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            team_code TEXT,
+            lead_id INTEGER,
+            member_count INTEGER
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER,
+            member_id INTEGER,
+            github_link TEXT,
+            submitted_on TEXT
+        )
+        """,
+    ]),
+    (2, "indexes for route queries", [
+        "CREATE INDEX IF NOT EXISTS idx_tasks_team_id ON tasks(team_id, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_teams_lead_id ON teams(lead_id)",
+        "CREATE INDEX IF NOT EXISTS idx_teams_team_code ON teams(team_code)",
+        "CREATE INDEX IF NOT EXISTS idx_users_team_role ON users(team_id, role)",
+        "CREATE INDEX IF NOT EXISTS idx_submissions_member_id ON submissions(member_id)",
+        "CREATE INDEX IF NOT EXISTS idx_submissions_task_id ON submissions(task_id)",
+        _create_unique_index("idx_users_username", "users", "username"),
+        _create_unique_index("idx_users_member_code", "users", "member_code"),
+    ]),
+    (3, "indexes for filtered task pages", [
+        "CREATE INDEX IF NOT EXISTS idx_tasks_team_status ON tasks(team_id, status, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_team_priority ON tasks(team_id, priority, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_team_assigned ON tasks(team_id, assigned_to, id DESC)",
+    ]),
+    (4, "persistent AI result cache", [
+        """
+        CREATE TABLE IF NOT EXISTS ai_cache (
+            key TEXT PRIMARY KEY,
+            kind TEXT,
+            task_id INTEGER,
+            value TEXT,
+            created_at TEXT
+        )
+        """,
+    ]),
+    (5, "background AI jobs", [
+        """
+        CREATE TABLE IF NOT EXISTS ai_jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT,
+            status TEXT,
+            user_id INTEGER,
+            task_id INTEGER,
+            result TEXT,
+            error TEXT,
+            created_at TEXT,
+            finished_at TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_ai_jobs_created_at ON ai_jobs(created_at)",
+    ]),
+    (6, "materialized delay risk", [
+        """
+        CREATE TABLE IF NOT EXISTS task_risk (
+            task_id INTEGER PRIMARY KEY,
+            team_id INTEGER,
+            risk TEXT,
+            computed_at TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_task_risk_team ON task_risk(team_id, risk)",
+        lambda conn: refresh_task_risk(conn),
+    ]),
+    (7, "trigger-maintained team_stats", [
+        lambda conn: create_team_stats(conn),
+        lambda conn: rebuild_team_stats(conn),
+    ]),
+    (8, "full-text task search", [
+        lambda conn: create_task_search(conn),
+    ]),
+    (9, "per-team change counters", [
+        lambda conn: create_team_versions(conn),
+    ]),
+    (10, "redeemable member codes", [
+        """
+        CREATE TABLE IF NOT EXISTS member_codes (
+            code TEXT PRIMARY KEY,
+            team_id INTEGER NOT NULL,
+            claimed_by INTEGER,
+            claimed_at TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_member_codes_team ON member_codes(team_id, code)",
+        lambda conn: backfill_member_codes(conn),
+    ]),
+    (11, "cold archive tables", [
+        """
+        CREATE TABLE IF NOT EXISTS tasks_archive (
+            id INTEGER PRIMARY KEY,
+            task TEXT,
+            assigned_to TEXT,
+            priority TEXT,
+            status TEXT,
+            created_at TEXT,
+            sub_tasks TEXT,
+            explanation TEXT,
+            team_id INTEGER,
+            archived_at TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_tasks_archive_team ON tasks_archive(team_id, id DESC)",
+        """
+        CREATE TABLE IF NOT EXISTS submissions_archive (
+            id INTEGER PRIMARY KEY,
+            task_id INTEGER,
+            member_id INTEGER,
+            github_link TEXT,
+            submitted_on TEXT,
+            archived_at TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_submissions_archive_task ON submissions_archive(task_id)",
+    ]),
+    (12, "ai_cache rows by task", [
+        "CREATE INDEX IF NOT EXISTS idx_ai_cache_task ON ai_cache(task_id)",
+    ]),
+    (13, "when tasks were marked Done", [
+        lambda conn: ensure_column_exists(conn, "tasks", "done_at", "TEXT"),
+        lambda conn: ensure_column_exists(conn, "tasks_archive", "done_at", "TEXT"),
+    ]),
+    (14, "submissions carry their team", [
+        lambda conn: ensure_column_exists(conn, "submissions", "team_id", "INTEGER"),
+        lambda conn: ensure_column_exists(conn, "submissions_archive", "team_id", "INTEGER"),
+        "UPDATE submissions SET team_id = (SELECT team_id FROM tasks WHERE tasks.id = submissions.task_id) "
+        "WHERE team_id IS NULL",
+        "UPDATE submissions_archive SET team_id = (SELECT team_id FROM tasks_archive "
+        "WHERE tasks_archive.id = submissions_archive.task_id) WHERE team_id IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_submissions_team ON submissions(team_id, id DESC)",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn, target=None):
+    """Apply pending migrations up to ``target`` (default: latest).
+
+    Each migration runs in its own BEGIN IMMEDIATE transaction and re-checks
+    the version once it holds the write lock, so several processes starting
+    at the same time apply every migration exactly once.
+    Returns the list of versions applied.
+    """
+    target = SCHEMA_VERSION if target is None else target
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT
+        )
+    """)
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version > target or version <= schema_version(conn):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= schema_version(conn):
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                         (version, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+def init_db():
+    """Create or upgrade the schema of DB_PATH to the latest version."""
+    conn = db_pool.acquire()
+    try:
+        return run_migrations(conn)
+    finally:
+        db_pool.release(conn)
+
+
+# Importing this module touches no database. The schema is brought up to date
+# once per process by init_app(), or else by the first request/CLI command;
+# gunicorn.conf.py does it in the master so forked workers inherit the flag.
+# AUTO_MIGRATE=0 leaves migrations entirely to `flask migrate`.
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1") == "1"
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def ensure_schema():
+    global _schema_ready
+    if _schema_ready or not AUTO_MIGRATE:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            init_db()
+            _schema_ready = True
+
+
+def init_app():
+    """Migrate the schema for this process and return the module's ``app``.
+
+    Not a factory: configuration is read from the environment at import, so
+    there is one app per process. WSGI entry point: ``app:init_app()``.
+    """
+    ensure_schema()
+    return app
+
+
+@app.before_request
+def _ensure_schema():
+    ensure_schema()
+
+
+# Representative parameterised form of every team/user scoped query a route
+# runs. `flask query-plans` checks that none of them needs a full scan.
+ROUTE_QUERIES = [
+    ("current_user", "SELECT * FROM users WHERE id=?", (1,)),
+    ("lead_register", "SELECT * FROM users WHERE username=?", ("u",)),
+    ("lead_login", "SELECT * FROM users WHERE username=? AND password=? AND role='lead'", ("u", "p")),
+    ("member_join: claim", "UPDATE member_codes SET claimed_at=? WHERE code=? AND claimed_at IS NULL",
+                           ("2024-01-01 00:00:00", "T-01")),
+    ("member_join: team", "SELECT team_id FROM member_codes WHERE code=?", ("T-01",)),
+    ("member_join: code", "SELECT claimed_at FROM member_codes WHERE code=?", ("T-01",)),
+    ("create_team: code taken", "SELECT 1 FROM teams WHERE team_code=?", ("T",)),
+    ("profile: codes", "SELECT code, claimed_at, display_name FROM member_codes LEFT JOIN users ON users.id = claimed_by "
+                       "WHERE member_codes.team_id=? ORDER BY code", (1,)),
+    ("lead team", "SELECT * FROM teams WHERE lead_id=?", (1,)),
+    ("team tasks", "SELECT * FROM tasks WHERE team_id=? ORDER BY id DESC", (1,)),
+    ("task page", "SELECT * FROM tasks WHERE team_id=? AND id < ? ORDER BY id DESC LIMIT ?", (1, 100, 51)),
+    ("task page: newer", "SELECT * FROM tasks WHERE team_id=? AND id > ? ORDER BY id ASC LIMIT ?", (1, 100, 51)),
+    ("task page: status", "SELECT * FROM tasks WHERE team_id=? AND status=? AND id < ? ORDER BY id DESC LIMIT ?", (1, "Done", 100, 51)),
+    ("task page: priority", "SELECT * FROM tasks WHERE team_id=? AND priority=? ORDER BY id DESC LIMIT ?", (1, "High", 51)),
+    ("task page: assignee", "SELECT * FROM tasks WHERE team_id=? AND assigned_to=? ORDER BY id DESC LIMIT ?", (1, "2", 51)),
+    ("task page: all teams", "SELECT * FROM tasks WHERE id < ? ORDER BY id DESC LIMIT ?", (100, 51)),
+    ("task page: archived", "SELECT * FROM tasks_archive AS tasks WHERE team_id=? AND id < ? ORDER BY id DESC LIMIT ?",
+                            (1, 100, 51)),
+    ("archive batch", "SELECT id FROM tasks WHERE status='Done' AND COALESCE(done_at, created_at) < ? AND id > ? "
+                      "ORDER BY id LIMIT ?",
+                      ("2024-01-01 00:00:00", 0, 500)),
+    ("team members", "SELECT id, display_name FROM users WHERE team_id=? AND role='member'", (1,)),
+    ("member submissions", "SELECT * FROM submissions WHERE member_id=?", (1,)),
+    ("task by id", "SELECT * FROM tasks WHERE id=?", (1,)),
+    ("delete: submissions", "DELETE FROM submissions WHERE task_id IN (SELECT id FROM tasks WHERE team_id=? AND id IN (?))", (1, 1)),
+    ("delete: ai_cache", "DELETE FROM ai_cache WHERE task_id IN (SELECT id FROM tasks WHERE team_id=? AND id IN (?))", (1, 1)),
+    ("member_mark_done", "SELECT * FROM tasks WHERE id=? AND team_id=?", (1, 1)),
+    ("delay page", "SELECT tasks.*, task_risk.risk AS prediction FROM tasks LEFT JOIN task_risk ON task_risk.task_id = tasks.id "
+                   "WHERE tasks.team_id=? ORDER BY tasks.id DESC LIMIT ?", (1, 51)),
+    ("team stats", "SELECT * FROM team_stats WHERE team_id=?", (1,)),
+    ("team version", "SELECT version, updated_at FROM team_versions WHERE team_id=?", (1,)),
+    ("api submissions: member", "SELECT * FROM submissions WHERE member_id=? AND submissions.id < ? "
+                                "ORDER BY submissions.id DESC LIMIT ?", (1, 100, 51)),
+    ("api submissions: team", "SELECT * FROM submissions WHERE team_id=? AND submissions.id < ? "
+                              "ORDER BY submissions.id DESC LIMIT ?", (1, 100, 51)),
+    ("profile: team", "SELECT * FROM teams WHERE id=?", (1,)),
+    ("profile: members", "SELECT display_name, username FROM users WHERE team_id=? AND role='member'", (1,)),
+]
+
+
+def check_query_plans(conn, queries=ROUTE_QUERIES):
+    """Return [(name, plan, ok)] where ok means no full scan or temp sort."""
+    results = []
+    for name, sql, params in queries:
+        plan = [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        ok = not any(d.startswith("SCAN") or "TEMP B-TREE" in d for d in plan)
+        results.append((name, plan, ok))
+    return results
+
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Apply pending schema migrations (to every shard too, with SHARD_DIR)."""
+    applied = init_db()
+    click.echo(f"applied: {applied or 'nothing'} (schema version {SCHEMA_VERSION})")
+    if shards is not None:
+        # opening a shard's pool migrates it
+        click.echo(f"shards up to date: {sum(1 for _ in database_pools()) - 1}")
+
+
+@app.cli.command("query-plans")
+def query_plans_command():
+    """Show route query plans without and with the migration indexes."""
+    scratch = sqlite3.connect(":memory:", cached_statements=0)  # plans must not outlive the DROPs
+    run_migrations(scratch)
+    after = check_query_plans(scratch)
+    # "before": the same tables with every secondary index dropped
+    for (name,) in scratch.execute("SELECT name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL").fetchall():
+        scratch.execute(f"DROP INDEX {name}")
+    before = check_query_plans(scratch)
+    scratch.close()
+    for (name, old, _), (_, new, ok) in zip(before, after):
+        click.echo(f"{'ok  ' if ok else 'SCAN'} {name}")
+        click.echo(f"     before: {'; '.join(old)}")
+        click.echo(f"     after:  {'; '.join(new)}")
+
+    ensure_schema()
+    conn = db_pool.acquire()
+    live = check_query_plans(conn)
+    db_pool.release(conn)
+    bad = [name for name, _, ok in live + after if not ok]
+    if bad:
+        raise click.ClickException("unindexed queries: " + ", ".join(sorted(set(bad))))
+    click.echo(f"all {len(after)} route queries are index-backed")
+
+
+# ---------------- Small in-process caches ----------------
+class TTLCache:
+    """Thread-safe LRU mapping whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
 
 
 # ---------------- Auth Helpers ----------------
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", "30"))
+# short-lived copies of users/teams rows keyed by ("user", id), ("lead_team",
+# lead id) or ("team", id); writes to those rows must call forget_identity()
+identity_cache = TTLCache(4096, IDENTITY_CACHE_TTL)
+
+
 def create_member_codes(team_code, count):
     """Return list of unique member codes for a team, e.g., TEAM123-01, TEAM123-02"""
     codes = []
@@ -134,14 +1075,64 @@ def generate_team_code():
     return "TEAM" + ''.join(random.choices(string.ascii_uppercase + string.digits, k=5))
 
 
+def backfill_member_codes(conn):
+    """Fill member_codes for teams created before codes were stored.
+
+    Codes members already joined with are claimed by them (including any
+    that don't follow the TEAM-NN pattern); the rest of each team's
+    member_count codes become redeemable.
+    """
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn.execute("""
+        INSERT OR IGNORE INTO member_codes (code, team_id, claimed_by, claimed_at)
+        SELECT member_code, team_id, id, ? FROM users
+        WHERE member_code IS NOT NULL AND team_id IS NOT NULL
+    """, (now,))
+    for team in conn.execute("SELECT id, team_code, member_count FROM teams").fetchall():
+        conn.executemany("INSERT OR IGNORE INTO member_codes (code, team_id) VALUES (?, ?)",
+                         [(code, team["id"]) for code in create_member_codes(team["team_code"], team["member_count"] or 0)])
+
+
+def _identity_row(key, sql, params):
+    row = identity_cache.get(key)
+    if row is None:
+        row = get_db().execute(sql, params).fetchone()
+        if row is not None:
+            identity_cache.set(key, row)
+    return row
+
+
 def current_user():
-    uid = session.get("user_id")
-    if not uid:
-        return None
-    conn = get_db()
-    user = conn.execute("SELECT * FROM users WHERE id=?", (uid,)).fetchone()
-    conn.close()
-    return user
+    """The logged-in user's row, resolved once per request and memoized on g."""
+    if "user" not in g:
+        uid = session.get("user_id")
+        g.user = _identity_row(("user", uid), "SELECT * FROM users WHERE id=?", (uid,)) if uid else None
+    return g.user
+
+
+def current_team():
+    """The current user's team: the team a lead runs, or the one a member joined."""
+    if "team" not in g:
+        user = current_user()
+        team = None
+        if user and user["role"] == "lead":
+            team = _identity_row(("lead_team", user["id"]), "SELECT * FROM teams WHERE lead_id=?", (user["id"],))
+        elif user and user["team_id"]:
+            team = _identity_row(("team", user["team_id"]), "SELECT * FROM teams WHERE id=?", (user["team_id"],))
+        g.team = team
+    return g.team
+
+
+def current_team_id():
+    team = current_team()
+    return team["id"] if team else None
+
+
+def forget_identity(*keys):
+    for key in keys:
+        identity_cache.pop(key)
+    g.pop("user", None)
+    g.pop("team", None)
 
 
 def login_required(role=None):
@@ -150,9 +1141,12 @@ def login_required(role=None):
         @wraps(fn)
         def wrapper(*args, **kwargs):
             user = current_user()
+            api = request.path.startswith("/api/")
             if not user:
-                return redirect(url_for("landing"))
+                return (jsonify({"error": "login required"}), 401) if api else redirect(url_for("landing"))
             if role and user["role"] != role:
+                if api:
+                    return jsonify({"error": "access denied"}), 403
                 flash("Access denied", "danger")
                 return redirect(url_for("home_for_role"))
             return fn(*args, **kwargs)
@@ -160,6 +1154,1433 @@ def login_required(role=None):
     return decorator
 
 
+# ---------------- Task pages (keyset pagination) ----------------
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 200
+TASK_FILTERS = ("status", "priority", "assigned_to")
+PRIORITIES = ("High", "Medium", "Low")
+STATUSES = ("To-Do", "In Progress", "Done")
+
+
+def _int_arg(name):
+    value = request.args.get(name, "")
+    return int(value) if value.isdigit() else None
+
+
+def wants_json():
+    best = request.accept_mimetypes.best_match(["application/json", "text/html"])
+    return best == "application/json" and request.accept_mimetypes[best] > request.accept_mimetypes["text/html"]
+
+
+def fetch_task_page(conn, team_id, all_teams=False, with_risk=False, archive=False):
+    """Fetch one page of tasks, newest first, driven by the query string.
+
+    ``?before=<id>`` pages to older tasks, ``?after=<id>`` back to newer ones,
+    ``?limit=`` caps the page size and ``status``/``priority``/``assigned_to``
+    filter in SQL, so each page is a single index range read however large the
+    team is. ``all_teams`` drops the team condition (anonymous task list);
+    ``with_risk`` adds the precomputed ``task_risk.risk`` as ``prediction``.
+    ``archive`` lets ``?archived=1`` merge in the team's tasks_archive rows.
+    """
+    limit = min(_int_arg("limit") or PAGE_SIZE, MAX_PAGE_SIZE)
+    before, after = _int_arg("before"), _int_arg("after")
+    filters = {k: request.args.get(k, "").strip() for k in TASK_FILTERS}
+    filters = {k: v for k, v in filters.items() if v}
+    archived = archive and request.args.get("archived") in ("1", "true", "yes")
+
+    where, params = [], []
+    if not all_teams:
+        where.append("tasks.team_id=?")
+        params.append(team_id)
+    for col, value in filters.items():
+        where.append(f"tasks.{col}=?")
+        params.append(value)
+    if after is not None:
+        where.append("tasks.id > ?")
+        params.append(after)
+        order = "ASC"
+    else:
+        if before is not None:
+            where.append("tasks.id < ?")
+            params.append(before)
+        order = "DESC"
+    sql = "SELECT tasks.* FROM tasks"
+    if with_risk:
+        sql = ("SELECT tasks.*, task_risk.risk AS prediction FROM tasks "
+               "LEFT JOIN task_risk ON task_risk.task_id = tasks.id")
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY tasks.id {order} LIMIT ?"
+
+    tasks = None
+    if task_snapshots is not None and team_id and not all_teams and not with_risk and not archived:
+        tasks = task_snapshots.page(conn, team_id, filters, before, after, limit + 1)
+    if tasks is None:
+        tasks = conn.execute(sql, params + [limit + 1]).fetchall() if all_teams or team_id else []
+    if archived and team_id:
+        # same range read on the archive; ids never overlap, so merge and cut
+        cold = conn.execute(sql.replace("FROM tasks", "FROM tasks_archive AS tasks", 1), params + [limit + 1])
+        tasks = sorted(tasks + cold.fetchall(), key=lambda t: t["id"], reverse=order == "DESC")[:limit + 1]
+    more = len(tasks) > limit
+    tasks = tasks[:limit]
+    if after is not None:
+        tasks.reverse()
+
+    if after is not None:
+        has_newer, has_older = more, bool(tasks)
+    else:
+        has_newer, has_older = before is not None, more
+    query = dict(filters)
+    if limit != PAGE_SIZE:
+        query["limit"] = limit
+    if archived:
+        query["archived"] = 1
+    return {
+        "tasks": tasks,
+        "filters": filters,
+        "query": query,
+        "archived": archived if archive else None,
+        "newer": tasks[0]["id"] if tasks and has_newer else None,
+        "older": tasks[-1]["id"] if tasks and has_older else None,
+    }
+
+
+def team_members(conn, team_id):
+    return conn.execute("""
+        SELECT id, display_name
+        FROM users
+        WHERE team_id=? AND role='member'
+    """, (team_id,)).fetchall()
+
+
+# ---------------- Team task snapshots (optional) ----------------
+# With TASK_SNAPSHOTS=1 fetch_task_page serves team task pages from memory;
+# a snapshot is valid for one team version (see "Task snapshots" in the README).
+TASK_SNAPSHOTS_ENABLED = os.getenv("TASK_SNAPSHOTS", "0") == "1"
+TASK_SNAPSHOT_BYTES = int(os.getenv("TASK_SNAPSHOT_BYTES", str(64 << 20)))
+TASK_FIELDS = ("id", "task", "assigned_to", "priority", "status", "created_at", "sub_tasks", "explanation", "team_id",
+               "done_at")
+
+
+class TaskRecord:
+    """One tasks row in ``__slots__``; reads like sqlite3.Row (``rec["id"]``, ``dict(rec)``)."""
+
+    __slots__ = TASK_FIELDS
+
+    def __init__(self, *values):
+        for name, value in zip(TASK_FIELDS, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_row(cls, row, **changes):
+        return cls(*(changes.get(f, row[f]) for f in TASK_FIELDS))
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def keys(self):
+        return TASK_FIELDS
+
+    def nbytes(self):
+        return sys.getsizeof(self) + sum(sys.getsizeof(getattr(self, f)) for f in TASK_FIELDS)
+
+
+class TeamSnapshot:
+    """A team's tasks in id order: an ``array('q')`` of ids beside a list of records."""
+
+    __slots__ = ("version", "ids", "records", "nbytes")
+
+    def __init__(self, version, records):
+        self.version = version
+        self.records = records
+        self.ids = array("q", (r.id for r in records))
+        self.nbytes = sum(r.nbytes() for r in records) + 16 * len(records)
+
+    def page(self, filters, before, after, n):
+        """Up to ``n`` matching records, in the order fetch_task_page's SQL returns them."""
+        if after is not None:
+            positions = range(bisect.bisect_right(self.ids, after), len(self.ids))
+        else:
+            end = bisect.bisect_left(self.ids, before) if before is not None else len(self.ids)
+            positions = range(end - 1, -1, -1)
+        found = []
+        for i in positions:
+            record = self.records[i]
+            if all(getattr(record, k) == v for k, v in filters.items()):
+                found.append(record)
+                if len(found) == n:
+                    break
+        return found
+
+    def upsert(self, record):
+        i = bisect.bisect_left(self.ids, record.id)
+        if i < len(self.ids) and self.ids[i] == record.id:
+            self.nbytes += record.nbytes() - self.records[i].nbytes()
+            self.records[i] = record
+        else:
+            self.ids.insert(i, record.id)
+            self.records.insert(i, record)
+            self.nbytes += record.nbytes() + 16
+
+    def delete(self, task_id):
+        i = bisect.bisect_left(self.ids, task_id)
+        if i < len(self.ids) and self.ids[i] == task_id:
+            self.nbytes -= self.records[i].nbytes() + 16
+            del self.ids[i]
+            del self.records[i]
+
+
+class TaskSnapshots:
+    """Per-process LRU of TeamSnapshot, evicted to stay under ``budget`` bytes."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.bytes = 0
+        self.stats = {"hit": 0, "load": 0, "patched": 0, "dropped": 0, "evicted": 0}
+        self._teams = OrderedDict()
+        self._too_big = {}  # team_id -> task count that did not fit
+        self._lock = threading.Lock()
+
+    def page(self, conn, team_id, filters, before, after, n):
+        """One page from the team's snapshot (loading it if needed), or None to use SQL."""
+        if team_id in self._too_big:
+            # retry once the team has shrunk (e.g. after `flask archive`)
+            if team_stats(conn, team_id)["total"] >= self._too_big[team_id]:
+                return None
+            self._too_big.pop(team_id, None)
+        version, _ = team_version(team_id)
+        with self._lock:
+            snapshot = self._teams.get(team_id)
+            if snapshot is not None and snapshot.version == version:
+                self._teams.move_to_end(team_id)
+                self.stats["hit"] += 1
+                return snapshot.page(filters, before, after, n)
+        # the version was read first, so the rows are at least that new
+        rows = conn.execute(f"SELECT {', '.join(TASK_FIELDS)} FROM tasks WHERE team_id=? ORDER BY id", (team_id,))
+        snapshot = TeamSnapshot(version, [TaskRecord(*row) for row in rows])
+        with self._lock:
+            self.stats["load"] += 1
+            if not self._store(team_id, snapshot):
+                return None
+            return snapshot.page(filters, before, after, n)
+
+    def _store(self, team_id, snapshot):
+        old = self._teams.pop(team_id, None)
+        if old is not None:
+            self.bytes -= old.nbytes
+        # a team may use at most a quarter of the budget; larger ones stay on SQL
+        if snapshot.nbytes > self.budget // 4:
+            self._too_big[team_id] = len(snapshot.records)
+            return False
+        self._teams[team_id] = snapshot
+        self.bytes += snapshot.nbytes
+        while self.bytes > self.budget:
+            _, evicted = self._teams.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self.stats["evicted"] += 1
+        return True
+
+    def apply(self, team_id, version, record=None, deleted_id=None):
+        """Patch the team's snapshot after a write that left it at ``version``; drop it if it missed others."""
+        with self._lock:
+            snapshot = self._teams.get(team_id)
+            if snapshot is None:
+                return
+            if version not in (snapshot.version, snapshot.version + 1):
+                self.bytes -= self._teams.pop(team_id).nbytes
+                self.stats["dropped"] += 1
+                return
+            self.bytes -= snapshot.nbytes
+            if record is not None:
+                snapshot.upsert(record)
+            if deleted_id is not None:
+                snapshot.delete(deleted_id)
+            snapshot.version = version
+            self.bytes += snapshot.nbytes
+            self.stats["patched"] += 1
+
+
+task_snapshots = TaskSnapshots(TASK_SNAPSHOT_BYTES) if TASK_SNAPSHOTS_ENABLED else None
+
+
+def snapshot_write(team_id, record=None, deleted_id=None):
+    """Bring this worker's snapshot of ``team_id`` up to date after a single-task write has committed."""
+    if task_snapshots is not None and team_id is not None:
+        task_snapshots.apply(team_id, team_version(team_id)[0], record, deleted_id)
+
+
+# ---------------- Gemini client ----------------
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "20"))
+AI_BREAKER_THRESHOLD = int(os.getenv("AI_BREAKER_THRESHOLD", "5"))
+AI_BREAKER_RESET = float(os.getenv("AI_BREAKER_RESET", "30"))
+
+
+class AIUnavailable(Exception):
+    """Gemini is not configured, or the circuit breaker is open."""
+
+
+class GeminiClient:
+    """Process-wide Gemini access: one model per name, single-flight prompts, deadlines and a breaker."""
+
+    def __init__(self, model_name, timeout, threshold, reset_after):
+        self.model_name = model_name
+        self.timeout = timeout
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._configured = False
+        self._models = {}
+        self._inflight = {}
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self.metrics = {"calls": 0, "errors": 0, "coalesced": 0, "short_circuited": 0,
+                        "latency_sum": 0.0, "latency_max": 0.0}
+
+    def configured(self):
+        return GENAI and bool(os.getenv("GEMINI_API_KEY"))
+
+    def breaker_state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def ready(self):
+        """True when a call would actually be attempted right now."""
+        return self.configured() and self.breaker_state() != "open"
+
+    def model(self, name=None):
+        name = name or self.model_name
+        with self._lock:
+            if not self._configured:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                self._configured = True
+            if name not in self._models:
+                import google.generativeai as genai
+                self._models[name] = genai.GenerativeModel(name)
+            return self._models[name]
+
+    def _admit(self):
+        with self._lock:
+            state = self.breaker_state()
+            if state == "open" or (state == "half-open" and self._trial_running):
+                self.metrics["short_circuited"] += 1
+                raise AIUnavailable("AI temporarily unavailable")
+            if state == "half-open":
+                self._trial_running = True
+
+    def _record(self, ok, elapsed):
+        AI_LATENCY.observe(elapsed, "ok" if ok else "error")
+        with self._lock:
+            self.metrics["calls"] += 1
+            self.metrics["latency_sum"] += elapsed
+            self.metrics["latency_max"] = max(self.metrics["latency_max"], elapsed)
+            self._trial_running = False
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self.metrics["errors"] += 1
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+    def generate(self, prompt, timeout=None):
+        """Return the reply text for ``prompt``; raises AIUnavailable or the SDK error."""
+        if not self.configured():
+            raise AIUnavailable("AI not configured")
+        timeout = timeout or self.timeout
+        with self._lock:
+            leader = prompt not in self._inflight
+            if leader:
+                self._inflight[prompt] = Future()
+            else:
+                self.metrics["coalesced"] += 1
+            future = self._inflight[prompt]
+        if not leader:
+            return future.result(timeout=timeout)
+
+        try:
+            self._admit()
+            start = time.perf_counter()
+            try:
+                resp = self.model().generate_content(prompt, request_options={"timeout": timeout})
+                text = getattr(resp, "text", "") or str(resp)
+            except Exception:
+                self._record(False, time.perf_counter() - start)
+                raise
+            self._record(True, time.perf_counter() - start)
+            future.set_result(text)
+            return text
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(prompt, None)
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.metrics)
+        calls = data["calls"]
+        data["latency_avg"] = data["latency_sum"] / calls if calls else 0.0
+        data["error_rate"] = data["errors"] / calls if calls else 0.0
+        data["breaker"] = self.breaker_state()
+        data["in_flight"] = len(self._inflight)
+        return data
+
+
+ai_client = GeminiClient(GEMINI_MODEL, AI_TIMEOUT, AI_BREAKER_THRESHOLD, AI_BREAKER_RESET)
+
+
+# ---------------- AI result cache ----------------
+# Bump AI_PROMPT_VERSION whenever a prompt below changes: it is part of the
+# cache key, so old answers stop matching.
+AI_PROMPT_VERSION = 1
+EXPLAIN_PROMPT = "Explain this task in 3 short sentences: {task}"
+SUBTASKS_PROMPT = """
+You are an expert software engineer. Break the following task into a JSON object with key "subtasks" containing 5 detailed subtasks (each short and actionable). Return ONLY the JSON.
+
+Task: {task}
+
+Exact format:
+{{ "subtasks": ["subtask1", "subtask2", "subtask3", "subtask4", "subtask5"] }}
+"""
+CHAT_PROMPT = "You are an assistant for students building projects. Answer concisely and help debug or suggest steps for: {question}"
+SUGGESTIONS_PROMPT = """
+Return ONLY JSON in this format:
+{{ "tasks": ["task1","task2","task3","task4","task5","task6"] }}
+
+Project: {project}
+"""
+
+# canned answers used whenever Gemini is unavailable or fails
+EXPLAIN_FALLBACK = "Fallback: This task '{task}' should be broken into subtasks and implemented based on priority."
+SUBTASKS_FALLBACK = [
+    "Analyze requirements and acceptance criteria",
+    "Create module-level design and diagrams",
+    "Implement core logic and endpoints",
+    "Write unit and integration tests",
+    "Run manual tests and deploy to staging"
+]
+SUGGESTIONS_FALLBACK = [
+    "Define project scope and requirements",
+    "Design UI/UX wireframes",
+    "Set up backend & database",
+    "Implement core features and APIs",
+    "Integrate AI and business logic",
+    "Test, document and deploy"
+]
+CHAT_FALLBACK = "AI not configured. Try asking about specific errors or steps (e.g., 'How to set up JWT auth in Flask?')."
+
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "1024"))
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", "86400"))
+
+
+class AIResultCache:
+    """Two-tier cache of Gemini answers: in-process TTLCache over the ai_cache table.
+
+    Keys hash (model, prompt version, kind, task text), so editing a task's
+    text or a prompt invalidates its entries without any bookkeeping. Only
+    real AI answers are stored, never the canned fallbacks.
+    """
+
+    # kind -> tasks column that mirrors the latest answer for the task
+    TASK_COLUMNS = {"explain": "explanation", "subtasks": "sub_tasks"}
+
+    def __init__(self, maxsize, ttl):
+        self.memory = TTLCache(maxsize, ttl)
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(kind, text):
+        raw = "\0".join([GEMINI_MODEL, str(AI_PROMPT_VERSION), kind, text or ""])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, conn, kind, text):
+        key = self.key(kind, text)
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return value
+        row = conn.execute("SELECT value FROM ai_cache WHERE key=?", (key,)).fetchone()
+        if row is not None:
+            self.stats["db_hits"] += 1
+            value = json.loads(row["value"])
+            self.memory.set(key, value)
+            return value
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, conn, kind, text, value, task_id=None):
+        """Store ``value`` in both tiers (and the task's column) and commit."""
+        self.put_many(conn, [(kind, text, value, task_id)])
+
+    def put_many(self, conn, entries):
+        """Store many ``(kind, text, value, task_id)`` entries in one commit."""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows, columns = [], {}
+        for kind, text, value, task_id in entries:
+            encoded = json.dumps(value)
+            rows.append((self.key(kind, text), kind, task_id, encoded, now))
+            if task_id is not None:
+                columns.setdefault(self.TASK_COLUMNS[kind], []).append(
+                    (value if isinstance(value, str) else encoded, task_id))
+        conn.executemany("INSERT OR REPLACE INTO ai_cache (key, kind, task_id, value, created_at) VALUES (?, ?, ?, ?, ?)",
+                         rows)
+        for column, params in columns.items():
+            conn.executemany(f"UPDATE tasks SET {column}=? WHERE id=?", params)
+        conn.commit()
+        for kind, text, value, _ in entries:
+            self.memory.set(self.key(kind, text), value)
+
+
+ai_cache = AIResultCache(AI_CACHE_SIZE, AI_CACHE_TTL)
+
+
+# ---------------- Background AI jobs ----------------
+AI_WORKERS = int(os.getenv("AI_WORKERS", "4"))
+AI_QUEUE_LIMIT = int(os.getenv("AI_QUEUE_LIMIT", "32"))
+AI_JOB_RETENTION_HOURS = 24
+
+
+class AIQueueFull(Exception):
+    pass
+
+
+class AIJobQueue:
+    """Runs Gemini calls on a bounded thread pool instead of request threads.
+
+    ``submit`` records the job in ``ai_jobs`` and returns its id straight
+    away; pages render a placeholder and poll ``/ai-jobs/<id>``. At most
+    ``limit`` jobs may be queued or running - beyond that ``submit`` raises
+    AIQueueFull and the caller serves its fallback.
+    A job function takes a connection - to ``team_id``'s data when given -
+    and returns ``(result, error)``; meanwhile it may ``report`` a partial result.
+    """
+
+    def __init__(self, workers, limit):
+        self.workers = workers
+        self.limit = limit
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._finished = 0
+
+    def _ensure_started(self):
+        # worker threads do not survive a fork; start a fresh pool per process
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="ai-job")
+                    self._slots = threading.BoundedSemaphore(self.limit)
+                    self._pid = os.getpid()
+
+    def submit(self, conn, kind, fn, user_id=None, task_id=None, team_id=None):
+        self._ensure_started()
+        if not self._slots.acquire(blocking=False):
+            raise AIQueueFull(kind)
+        job_id = uuid.uuid4().hex
+        try:
+            conn.execute("INSERT INTO ai_jobs (id, kind, status, user_id, task_id, created_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                         (job_id, kind, user_id, task_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            conn.commit()
+            self._executor.submit(self._run, job_id, fn, team_id)
+        except Exception:
+            self._slots.release()
+            raise
+        return job_id
+
+    def _run(self, job_id, fn, team_id):
+        conn = db_pool.acquire()
+        pool = team_pool(team_id)
+        data = conn if pool is db_pool else pool.acquire()
+        try:
+            conn.execute("UPDATE ai_jobs SET status='running' WHERE id=?", (job_id,))
+            conn.commit()
+            self._local.job_id = job_id
+            try:
+                result, error = fn(data)
+                status = "done"
+            except Exception as e:
+                result, error, status = None, f"AI error: {e}", "error"
+            finally:
+                self._local.job_id = None
+            conn.execute("UPDATE ai_jobs SET status=?, result=?, error=?, finished_at=? WHERE id=?",
+                         (status, json.dumps(result), error, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), job_id))
+            conn.commit()
+            self._finished += 1
+            if self._finished % 100 == 0:
+                self._prune(conn)
+        except Exception:
+            app.logger.exception("AI job %s failed", job_id)
+        finally:
+            if data is not conn:
+                pool.release(data)
+            db_pool.release(conn)
+            self._slots.release()
+
+    def report(self, result):
+        """Store a partial result for the job running on this thread (no-op outside a job)."""
+        job_id = getattr(self._local, "job_id", None)
+        if job_id is None:
+            return
+        conn = db_pool.acquire()
+        try:
+            conn.execute("UPDATE ai_jobs SET result=? WHERE id=? AND status='running'", (json.dumps(result), job_id))
+            conn.commit()
+        finally:
+            db_pool.release(conn)
+
+    @staticmethod
+    def _prune(conn):
+        cutoff = datetime.fromtimestamp(time.time() - AI_JOB_RETENTION_HOURS * 3600)
+        conn.execute("DELETE FROM ai_jobs WHERE created_at < ?", (cutoff.strftime("%Y-%m-%d %H:%M:%S"),))
+        conn.commit()
+
+
+ai_jobs = AIJobQueue(AI_WORKERS, AI_QUEUE_LIMIT)
+
+
+def _parse_json_list(text, key):
+    data = json.loads(text)
+    if isinstance(data, dict) and isinstance(data.get(key), list):
+        return data[key]
+    return []
+
+
+def explain_job(task_id, text):
+    def run(conn):
+        try:
+            explanation = ai_client.generate(EXPLAIN_PROMPT.format(task=text))
+        except Exception as e:
+            return {"text": EXPLAIN_FALLBACK.format(task=text)}, f"AI error: {e}"
+        if not explanation:
+            return {"text": EXPLAIN_FALLBACK.format(task=text)}, None
+        ai_cache.put(conn, "explain", text, explanation, task_id=task_id)
+        return {"text": explanation}, None
+    return run
+
+
+def subtasks_job(task_id, text):
+    def run(conn):
+        try:
+            subtasks = _parse_json_list(ai_client.generate(SUBTASKS_PROMPT.format(task=text)), "subtasks")
+        except Exception as e:
+            return {"items": SUBTASKS_FALLBACK}, f"AI error: {e}"
+        if not subtasks:
+            return {"items": SUBTASKS_FALLBACK}, None
+        ai_cache.put(conn, "subtasks", text, subtasks, task_id=task_id)
+        return {"items": subtasks}, None
+    return run
+
+
+def suggestions_job(project_desc):
+    def run(conn):
+        try:
+            tasks = _parse_json_list(ai_client.generate(SUGGESTIONS_PROMPT.format(project=project_desc)), "tasks")
+        except Exception as e:
+            return {"items": SUGGESTIONS_FALLBACK}, f"AI error: {e}"
+        return {"items": tasks or SUGGESTIONS_FALLBACK}, None
+    return run
+
+
+def chat_job(question):
+    def run(conn):
+        try:
+            return {"text": ai_client.generate(CHAT_PROMPT.format(question=question))}, None
+        except Exception as e:
+            return {"text": CHAT_FALLBACK}, f"AI error: {e}"
+    return run
+
+
+@app.route("/ai/metrics")
+@login_required(role="lead")
+def ai_metrics():
+    """Gemini latency/error counters, breaker state and AI cache hit rates."""
+    return jsonify({"client": ai_client.snapshot(), "cache": ai_cache.stats})
+
+
+@app.route("/ai-jobs/<job_id>")
+def ai_job_status(job_id):
+    """Poll endpoint for the placeholders rendered while an AI job runs."""
+    conn = get_db()
+    job = conn.execute("SELECT * FROM ai_jobs WHERE id=?", (job_id,)).fetchone()
+    if not job or (job["user_id"] is not None and job["user_id"] != session.get("user_id")):
+        return jsonify({"error": "job not found"}), 404
+    return jsonify({
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "result": json.loads(job["result"]) if job["result"] else None,
+        "error": job["error"],
+    })
+
+
+# ---------------- Batched AI backfill ----------------
+AI_BATCH_SIZE = int(os.getenv("AI_BATCH_SIZE", "20"))
+AI_BATCH_CONCURRENCY = int(os.getenv("AI_BATCH_CONCURRENCY", "4"))
+BACKFILL_PROMPT = """
+You are an expert software engineer. For every task in the JSON list below, write an explanation of 3 short sentences and 5 detailed subtasks (each short and actionable).
+Return ONLY a JSON array with exactly one object per task, using the same ids:
+[{{ "id": 1, "explanation": "...", "subtasks": ["subtask1", "subtask2", "subtask3", "subtask4", "subtask5"] }}]
+
+Tasks:
+{tasks}
+"""
+
+
+def tasks_missing_ai(conn, team_id):
+    return conn.execute("""
+        SELECT id, task FROM tasks
+        WHERE team_id=? AND (explanation IS NULL OR explanation='' OR sub_tasks IS NULL OR sub_tasks='')
+        ORDER BY id
+    """, (team_id,)).fetchall()
+
+
+def _parse_backfill_reply(text, batch):
+    """Map task id -> (explanation, subtasks) for every well-formed item in a reply."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.index("\n") + 1:] if "\n" in text else ""
+    data = json.loads(text)
+    wanted = {row["id"] for row in batch}
+    parsed = {}
+    for item in data if isinstance(data, list) else []:
+        if not isinstance(item, dict) or item.get("id") not in wanted:
+            continue
+        explanation, subtasks = item.get("explanation"), item.get("subtasks")
+        if not isinstance(explanation, str) or not explanation.strip():
+            continue
+        if not isinstance(subtasks, list) or not subtasks or not all(isinstance(x, str) for x in subtasks):
+            continue
+        parsed[item["id"]] = (explanation.strip(), subtasks)
+    return parsed
+
+
+def backfill_team_ai(conn, team_id, batch_size=AI_BATCH_SIZE, concurrency=AI_BATCH_CONCURRENCY, progress=None):
+    """Generate explanations and subtasks for every team task still missing them.
+
+    Tasks are packed ``batch_size`` per prompt and the prompts run with at
+    most ``concurrency`` calls in flight. Valid answers are written back in
+    a single transaction; tasks whose answer is missing or malformed are
+    counted as failed and left for the next run. ``progress(processed, total)``
+    is called as each batch's answer comes back.
+    """
+    rows = tasks_missing_ai(conn, team_id)
+    batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+
+    def run(batch):
+        prompt = BACKFILL_PROMPT.format(tasks=json.dumps([{"id": r["id"], "task": r["task"]} for r in batch]))
+        try:
+            # a batch answer is much longer than a single one
+            return _parse_backfill_reply(ai_client.generate(prompt, timeout=AI_TIMEOUT * 3), batch), None
+        except Exception as e:
+            return {}, str(e)
+
+    results = []
+    if batches:
+        with ThreadPoolExecutor(min(concurrency, len(batches)), thread_name_prefix="ai-backfill") as pool:
+            for result in pool.map(run, batches):
+                results.append(result)
+                if progress:
+                    progress(sum(len(b) for b in batches[:len(results)]), len(rows))
+
+    entries, errors = [], []
+    for batch, (parsed, error) in zip(batches, results):
+        if error:
+            errors.append(error)
+        for row in batch:
+            if row["id"] in parsed:
+                explanation, subtasks = parsed[row["id"]]
+                entries.append(("explain", row["task"], explanation, row["id"]))
+                entries.append(("subtasks", row["task"], subtasks, row["id"]))
+    if entries:
+        ai_cache.put_many(conn, entries)
+    updated = len(entries) // 2
+    return {"tasks": len(rows), "updated": updated, "failed": len(rows) - updated,
+            "calls": len(batches), "errors": errors[:5]}
+
+
+def backfill_job(team_id):
+    def run(conn):
+        summary = backfill_team_ai(conn, team_id, progress=lambda done, total: ai_jobs.report(
+            {"processed": done, "tasks": total}))
+        return summary, ("; ".join(summary["errors"]) or None)
+    return run
+
+
+@app.route("/ai-backfill", methods=["GET", "POST"])
+@login_required(role="lead")
+def ai_backfill_lead():
+    user = current_user()
+    team_id = current_team_id()
+    pending = len(tasks_missing_ai(get_team_db(team_id), team_id)) if team_id else 0
+    job_id = None
+    error = None
+    if request.method == "POST" and pending:
+        if not ai_client.ready():
+            error = "AI is not available right now."
+        else:
+            try:
+                job_id = ai_jobs.submit(get_db(), "backfill", backfill_job(team_id), user_id=user["id"], team_id=team_id)
+            except AIQueueFull:
+                error = "AI is busy right now, please try again in a moment."
+    return render_template("ai_backfill.html", pending=pending, batch_size=AI_BATCH_SIZE,
+                           job_id=job_id, error=error)
+
+
+@app.cli.command("ai-backfill")
+@click.argument("team_id", type=int)
+def ai_backfill_command(team_id):
+    """Generate missing explanations/subtasks for a team in batched prompts."""
+    ensure_schema()
+    pool = team_pool(team_id)
+    conn = pool.acquire()
+    try:
+        click.echo(json.dumps(backfill_team_ai(conn, team_id)))
+    finally:
+        pool.release(conn)
+
+
+# ---------------- Delay risk ----------------
+# Same rules the delay page always used, evaluated by SQLite over tasks rows.
+RISK_SQL = """
+    CASE
+        WHEN priority = 'High' AND IFNULL(status, '') != 'Done' THEN 'High Delay Risk'
+        WHEN status = 'In Progress' THEN 'Possibly Delayed'
+        ELSE 'On Track'
+    END
+"""
+
+
+def refresh_task_risk(conn, task_ids=None, team_id=None, after_id=None):
+    """Recompute ``task_risk`` rows inside the caller's transaction.
+
+    Pass the ids a write touched (rows for deleted ids are dropped), or a
+    ``team_id`` to rebuild one team - only its tasks above ``after_id`` when
+    given, for freshly appended rows. With neither, every task is rebuilt.
+    """
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    upsert = f"INSERT OR REPLACE INTO task_risk (task_id, team_id, risk, computed_at) SELECT id, team_id, {RISK_SQL}, ? FROM tasks"
+    if task_ids is not None:
+        task_ids = list(task_ids)
+        for i in range(0, len(task_ids), 500):
+            chunk = task_ids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            conn.execute(f"{upsert} WHERE id IN ({marks})", [now] + chunk)
+            conn.execute(f"DELETE FROM task_risk WHERE task_id IN ({marks}) "
+                         f"AND task_id NOT IN (SELECT id FROM tasks WHERE id IN ({marks}))", chunk + chunk)
+    elif team_id is not None:
+        if after_id is None:
+            conn.execute("DELETE FROM task_risk WHERE team_id=?", (team_id,))
+        conn.execute(f"{upsert} WHERE team_id=? AND id > ?", (now, team_id, after_id or 0))
+    else:
+        conn.execute("DELETE FROM task_risk")
+        conn.execute(upsert, (now,))
+
+
+@app.cli.command("rebuild-risk")
+def rebuild_risk_command():
+    """Recompute the task_risk table for every task."""
+    ensure_schema()
+    for pool in database_pools():
+        conn = pool.acquire()
+        try:
+            refresh_task_risk(conn)
+            conn.commit()
+        finally:
+            pool.release(conn)
+    click.echo("task_risk rebuilt")
+
+
+# ---------------- Team summary counters ----------------
+# team_stats column -> condition on a tasks row. SQLite triggers keep one row
+# per team exact on every insert/update/delete of tasks.
+TEAM_STATS_COLUMNS = {
+    "todo": "status IS 'To-Do'",
+    "in_progress": "status IS 'In Progress'",
+    "done": "status IS 'Done'",
+    "high": "priority IS 'High'",
+    "medium": "priority IS 'Medium'",
+    "low": "priority IS 'Low'",
+}
+
+
+def create_team_stats(conn):
+    cols = list(TEAM_STATS_COLUMNS)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS team_stats (
+            team_id INTEGER PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            {", ".join(f"{c} INTEGER NOT NULL DEFAULT 0" for c in cols)}
+        )
+    """)
+
+    def flags(row):
+        return ", ".join(f"({cond.replace('status', row + '.status').replace('priority', row + '.priority')})"
+                         for cond in TEAM_STATS_COLUMNS.values())
+
+    add = f"""
+        INSERT INTO team_stats (team_id, total, {", ".join(cols)})
+        SELECT NEW.team_id, 1, {flags("NEW")} WHERE NEW.team_id IS NOT NULL
+        ON CONFLICT(team_id) DO UPDATE SET total = total + 1,
+            {", ".join(f"{c} = {c} + excluded.{c}" for c in cols)};
+    """
+    subtract = f"""
+        UPDATE team_stats SET total = total - 1,
+            {", ".join(f"{c} = {c} - ({cond.replace('status', 'OLD.status').replace('priority', 'OLD.priority')})"
+                       for c, cond in TEAM_STATS_COLUMNS.items())}
+        WHERE team_id = OLD.team_id;
+    """
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_team_stats_insert AFTER INSERT ON tasks BEGIN {add} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_team_stats_delete AFTER DELETE ON tasks BEGIN {subtract} END")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_team_stats_update AFTER UPDATE OF status, priority, team_id ON tasks
+        BEGIN {subtract} {add} END
+    """)
+
+
+def rebuild_team_stats(conn):
+    """Recount team_stats from tasks (inside the caller's transaction)."""
+    cols = list(TEAM_STATS_COLUMNS)
+    conn.execute("DELETE FROM team_stats")
+    conn.execute(f"""
+        INSERT INTO team_stats (team_id, total, {", ".join(cols)})
+        SELECT team_id, COUNT(*), {", ".join(f"SUM({cond})" for cond in TEAM_STATS_COLUMNS.values())}
+        FROM tasks WHERE team_id IS NOT NULL GROUP BY team_id
+    """)
+
+
+def team_stats(conn, team_id):
+    """Summary counters for a team - a single primary-key read."""
+    row = conn.execute("SELECT * FROM team_stats WHERE team_id=?", (team_id,)).fetchone()
+    if row is None:
+        return dict.fromkeys(["total"] + list(TEAM_STATS_COLUMNS), 0)
+    return {k: row[k] for k in row.keys() if k != "team_id"}
+
+
+@app.cli.command("rebuild-team-stats")
+def rebuild_team_stats_command():
+    """Recount the team_stats summary table from tasks."""
+    ensure_schema()
+    for pool in database_pools():
+        conn = pool.acquire()
+        try:
+            rebuild_team_stats(conn)
+            conn.commit()
+        finally:
+            pool.release(conn)
+    click.echo("team_stats rebuilt")
+
+
+@app.route("/api/team-stats")
+@login_required()
+def team_stats_api():
+    team = current_team()
+    if not team:
+        return jsonify({"error": "no team"}), 404
+    return jsonify({"team_id": team["id"], **team_stats(get_team_db(team["id"]), team["id"])})
+
+
+# ---------------- Task search (FTS5) ----------------
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGES = 50
+SEARCH_MAX_TERMS = 8
+SEARCH_PREFIX_MAX = 6  # longest prefix index on tasks_fts
+SNIPPET_OPEN, SNIPPET_CLOSE = "\x02", "\x03"
+
+
+def fts5_available(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+    except sqlite3.OperationalError:
+        return False
+    conn.execute("DROP TABLE temp.fts5_probe")
+    return True
+
+
+def create_task_search(conn):
+    """Create the external-content tasks_fts index and the triggers syncing it.
+
+    team_id is indexed as a column so a team filter is part of the MATCH and
+    never scans other teams' rows. Status and priority updates leave it alone.
+    Prefix indexes up to 6 characters keep search-as-you-type lookups lazy
+    instead of merging every matching term's doclist in memory.
+    """
+    if not fts5_available(conn):
+        app.logger.warning("SQLite was built without FTS5; /search is disabled")
+        return
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            task, explanation, sub_tasks, team_id,
+            content='tasks', content_rowid='id', prefix='2 3 4 5 6'
+        )
+    """)
+    cols = "task, explanation, sub_tasks, team_id"
+    add = f"INSERT INTO tasks_fts (rowid, {cols}) VALUES (NEW.id, NEW.task, NEW.explanation, NEW.sub_tasks, NEW.team_id);"
+    remove = (f"INSERT INTO tasks_fts (tasks_fts, rowid, {cols}) "
+              f"VALUES ('delete', OLD.id, OLD.task, OLD.explanation, OLD.sub_tasks, OLD.team_id);")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_insert AFTER INSERT ON tasks BEGIN {add} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_delete AFTER DELETE ON tasks BEGIN {remove} END")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_update AFTER UPDATE OF {cols} ON tasks
+        BEGIN {remove} {add} END
+    """)
+    conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+
+
+def search_enabled(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name='tasks_fts'").fetchone() is not None
+
+
+def search_match(team_id, text):
+    """Build the (title, body) MATCH expressions for a search, or None.
+
+    Every word must match, the last one as a prefix (of at most
+    SEARCH_PREFIX_MAX characters). ``title`` finds tasks
+    whose task text has them all, ``body`` the remaining ones that match
+    through explanation or subtasks. Words are reduced to letters/digits and
+    quoted, so user input can never inject FTS5 syntax.
+    """
+    terms = re.findall(r"\w+", text)[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    # a longer prefix than the index covers would make FTS5 merge the doclists
+    # of every term it matches, so it is matched on its first characters
+    words = [f'"{t}"' for t in terms[:-1]] + [f'"{terms[-1][:SEARCH_PREFIX_MAX]}"*']
+    team = f'team_id:"{int(team_id)}"'
+    title = f"{{task}}:({' '.join(words)})"
+    # only numbers could hit the team_id column; filtering every word would
+    # make FTS5 decode position lists for all of them
+    anywhere = " ".join(f"{{task explanation sub_tasks}}:{w}" if t.isdigit() else w for t, w in zip(terms, words))
+    return f"{team} AND {title}", f"({team} AND {anywhere}) NOT {title}"
+
+
+def _snippet_html(snippet):
+    return Markup(str(escape(snippet or "")).replace(SNIPPET_OPEN, "<mark>").replace(SNIPPET_CLOSE, "</mark>"))
+
+
+def _search_tier(conn, match, team_id, limit, offset):
+    if limit <= 0:
+        return []
+    return conn.execute(f"""
+        SELECT tasks.id, tasks.task, tasks.status, tasks.priority, tasks.assigned_to,
+               snippet(tasks_fts, -1, '{SNIPPET_OPEN}', '{SNIPPET_CLOSE}', '…', 12) AS snippet
+        FROM tasks_fts CROSS JOIN tasks ON tasks.id = tasks_fts.rowid  -- CROSS JOIN: the MATCH drives
+        WHERE tasks_fts MATCH ? AND tasks.team_id = ?
+        ORDER BY tasks_fts.rowid DESC LIMIT ? OFFSET ?
+    """, (match, team_id, limit, offset)).fetchall()
+
+
+def search_tasks(conn, team_id, text, page=1):
+    """One page of a team's tasks matching ``text``; returns (rows, has_more).
+
+    Title matches rank above explanation/subtask matches, newest first within
+    each. Both tiers are rowid-ordered walks of the index, so a page costs
+    the same however common the words are - bm25 would first count every
+    phrase across all teams, which alone takes tens of ms for frequent words.
+    """
+    match = search_match(team_id, text)
+    if match is None:
+        return [], False
+    title, body = match
+    want, offset = SEARCH_PAGE_SIZE + 1, (page - 1) * SEARCH_PAGE_SIZE
+    rows = _search_tier(conn, title, team_id, want, offset)
+    if len(rows) < want:
+        if rows or not offset:
+            title_total = offset + len(rows)
+        else:
+            title_total = conn.execute("SELECT COUNT(*) FROM tasks_fts WHERE tasks_fts MATCH ?", (title,)).fetchone()[0]
+        rows += _search_tier(conn, body, team_id, want - len(rows), max(0, offset - title_total))
+    results = [dict(r, snippet=_snippet_html(r["snippet"])) for r in rows[:SEARCH_PAGE_SIZE]]
+    return results, len(rows) > SEARCH_PAGE_SIZE
+
+
+@app.cli.command("rebuild-search")
+def rebuild_search_command():
+    """Rebuild and optimize the tasks_fts full-text index from tasks."""
+    ensure_schema()
+    for pool in database_pools():
+        conn = pool.acquire()
+        try:
+            if not search_enabled(conn):
+                raise click.ClickException("tasks_fts does not exist (SQLite without FTS5?)")
+            conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+            conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('optimize')")
+            conn.commit()
+        finally:
+            pool.release(conn)
+    click.echo("tasks_fts rebuilt")
+
+
+@app.route("/search")
+@login_required()
+def search():
+    team = current_team()
+    conn = get_team_db(team["id"] if team else None)
+    q = request.args.get("q", "").strip()
+    page = min(_int_arg("page") or 1, SEARCH_MAX_PAGES)
+    results, has_more = [], False
+    enabled = search_enabled(conn)
+    if q and team and enabled:
+        results, has_more = search_tasks(conn, team["id"], q, page)
+    return render_template("search.html", q=q, results=results, page=page,
+                           has_more=has_more and page < SEARCH_MAX_PAGES, enabled=enabled)
+
+
+# ---------------- JSON API (v1) ----------------
+# team_versions.version goes up on every write that changes what a team's API
+# responses contain, so it doubles as their ETag and a 304 costs one
+# primary-key read instead of re-running the page queries.
+TEAM_VERSION_SOURCES = {
+    "tasks": ("team_id", "team_id"),
+    "submissions": ("(SELECT team_id FROM tasks WHERE id = NEW.task_id)",
+                    "(SELECT team_id FROM tasks WHERE id = OLD.task_id)"),
+    "users": ("team_id", "team_id"),
+}
+
+
+def create_team_versions(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS team_versions (
+            team_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL
+        )
+    """)
+
+    def bump(team_expr):
+        return f"""
+            INSERT INTO team_versions (team_id, version, updated_at)
+            SELECT t, 1, strftime('%Y-%m-%d %H:%M:%S', 'now') FROM (SELECT {team_expr} AS t) WHERE t IS NOT NULL
+            ON CONFLICT(team_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+        """
+
+    for table, (new_team, old_team) in TEAM_VERSION_SOURCES.items():
+        new = new_team if new_team.startswith("(") else f"NEW.{new_team}"
+        old = old_team if old_team.startswith("(") else f"OLD.{old_team}"
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_version_insert AFTER INSERT ON {table} "
+                     f"BEGIN {bump(new)} END")
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_version_delete AFTER DELETE ON {table} "
+                     f"BEGIN {bump(old)} END")
+        # a row moving between teams changes both
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_version_update AFTER UPDATE ON {table} "
+                     f"BEGIN {bump(new)} {bump(f'NULLIF({old}, {new})')} END")
+    conn.execute("""
+        INSERT OR IGNORE INTO team_versions (team_id, version, updated_at)
+        SELECT id, 1, strftime('%Y-%m-%d %H:%M:%S', 'now') FROM teams
+    """)
+
+
+def team_version(team_id):
+    """(version, last modified as an aware UTC datetime) for a team.
+
+    With shards, task/submission writes count in the shard's team_versions
+    and member changes in the catalog's; the version is their sum.
+    """
+    version, updated = 0, None
+    for conn in {id(c): c for c in (get_db(), get_team_db(team_id))}.values():
+        row = conn.execute("SELECT version, updated_at FROM team_versions WHERE team_id=?", (team_id,)).fetchone()
+        if row is not None:
+            version += row["version"]
+            updated = max(updated or row["updated_at"], row["updated_at"])
+    if updated is None:
+        return version, None
+    return version, datetime.strptime(updated, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+
+
+def conditional_json(team_id, build):
+    """Answer a team-scoped GET from ``build()`` unless the client's copy is current.
+
+    The weak ETag combines the team version with the user and full query
+    string, so every page/filter/user gets its own validator. A matching
+    If-None-Match (or, without one, a fresh If-Modified-Since) returns 304
+    before ``build`` - and therefore any tasks query - runs.
+    """
+    version, modified = team_version(team_id)
+    user = current_user()
+    variant = zlib.crc32(f"{user['id']}:{request.full_path}".encode())
+    etag = f"t{team_id}-v{version}-{variant:08x}"
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    else:
+        fresh = bool(modified and request.if_modified_since and modified <= request.if_modified_since)
+    response = Response(status=304) if fresh else jsonify({"team_id": team_id, "version": version, **build()})
+    response.set_etag(etag, weak=True)
+    if modified:
+        response.last_modified = modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route("/api/v1/tasks")
+@login_required()
+def api_tasks():
+    team_id = current_team_id()
+    if team_id is None:
+        return jsonify({"error": "no team"}), 404
+
+    def build():
+        page = fetch_task_page(get_team_db(team_id), team_id)
+        links = {}
+        if page["newer"]:
+            links["newer"] = url_for("api_tasks", after=page["newer"], **page["query"])
+        if page["older"]:
+            links["older"] = url_for("api_tasks", before=page["older"], **page["query"])
+        return {"tasks": [dict(t) for t in page["tasks"]], "filters": page["filters"], "links": links}
+
+    return conditional_json(team_id, build)
+
+
+@app.route("/api/v1/submissions")
+@login_required()
+def api_submissions():
+    """A member's own submissions, or every submission on a lead's team, newest first."""
+    user = current_user()
+    team_id = current_team_id()
+    if team_id is None:
+        return jsonify({"error": "no team"}), 404
+
+    def build():
+        limit = min(_int_arg("limit") or PAGE_SIZE, MAX_PAGE_SIZE)
+        before = _int_arg("before")
+        if user["role"] == "member":
+            sql, params = "SELECT * FROM submissions WHERE member_id=?", [user["id"]]
+        else:
+            sql, params = "SELECT * FROM submissions WHERE team_id=?", [team_id]
+        if before:
+            sql += " AND submissions.id < ?"
+            params.append(before)
+        sql += " ORDER BY submissions.id DESC LIMIT ?"
+        rows = get_team_db(team_id).execute(sql, params + [limit + 1]).fetchall()
+        links = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            links["older"] = url_for("api_submissions", before=rows[-1]["id"], limit=_int_arg("limit"))
+        return {"submissions": [dict(r) for r in rows], "links": links}
+
+    return conditional_json(team_id, build)
+
+
+@app.route("/api/v1/members")
+@login_required()
+def api_members():
+    team_id = current_team_id()
+    if team_id is None:
+        return jsonify({"error": "no team"}), 404
+    return conditional_json(team_id, lambda: {"members": [dict(m) for m in team_members(get_db(), team_id)]})
+
+
+# ---------------- Rendered page cache ----------------
+# Dashboards and task lists are cached as rendered HTML per template, team,
+# user and full path. Each entry remembers the team version it was built at
+# and is only served while that is still current, so any write to the team's
+# tasks, submissions or members (see team_versions) invalidates its pages in
+# every worker without a message between them.
+FRAGMENT_CACHE_BYTES = int(os.getenv("FRAGMENT_CACHE_BYTES", str(32 << 20)))  # 0 disables the cache
+
+
+class FragmentCache:
+    """Thread-safe LRU of (version, body bytes) bounded by total body size."""
+
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.bytes = 0
+        self.stats = {"hit": 0, "miss": 0, "stale": 0, "evicted": 0}
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.stats["miss"] += 1
+                return None
+            if item[0] != version:
+                self.stats["stale"] += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats["hit"] += 1
+            return item[1]
+
+    def set(self, key, version, body):
+        # one page may use at most a quarter of the budget
+        if len(body) > self.maxbytes // 4:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[1])
+            self._data[key] = (version, body)
+            self.bytes += len(body)
+            while self.bytes > self.maxbytes:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.stats["evicted"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+fragment_cache = FragmentCache(FRAGMENT_CACHE_BYTES)
+
+
+def render_cached(template, team_id, build):
+    """``render_template(template, **build())``, served from fragment_cache while the team is unchanged.
+
+    The version is read before ``build`` runs its queries, so a page is never
+    stored under a newer version than the data it shows.
+    """
+    user = current_user()
+    if team_id is None or not user or not fragment_cache.maxbytes:
+        return render_template(template, **build())
+    version, _ = team_version(team_id)
+    key = (template, team_id, user["role"], user["id"], request.full_path)
+    body = fragment_cache.get(key, version)
+    if body is None:
+        body = render_template(template, **build()).encode()
+        fragment_cache.set(key, version, body)
+    return Response(body, mimetype="text/html")
+
+
+# ---------------- Live updates (Server-Sent Events) ----------------
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+EVENT_HEARTBEAT = float(os.getenv("EVENT_HEARTBEAT", "15"))
+# Each open stream holds a server thread (gthread) for as long as it stays
+# open, so a process only gives half of its GUNICORN_THREADS to streams by
+# default - and never all of them - leaving the rest for ordinary requests.
+SERVER_THREADS = int(os.getenv("GUNICORN_THREADS", "8"))
+EVENT_MAX_STREAMS = min(int(os.getenv("EVENT_MAX_STREAMS", str(SERVER_THREADS // 2))), SERVER_THREADS - 1)
+
+
+class EventHub:
+    """In-process pub/sub: one bounded queue per open /events stream, per team.
+
+    Publishing never blocks a write route. A stream that falls
+    EVENT_QUEUE_SIZE events behind has its backlog dropped and gets a single
+    ``resync`` event telling the page to reload. Streams live in one process;
+    with several workers each only sees its own writes.
+    """
+
+    def __init__(self, queue_size=EVENT_QUEUE_SIZE, max_streams=EVENT_MAX_STREAMS):
+        self.queue_size = queue_size
+        self.max_streams = max_streams
+        self._streams = {}
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "delivered": 0, "resyncs": 0, "rejected": 0}
+
+    def subscribe(self, team_id):
+        with self._lock:
+            if sum(len(qs) for qs in self._streams.values()) >= self.max_streams:
+                self.stats["rejected"] += 1
+                return None
+            q = queue.Queue(self.queue_size)
+            self._streams.setdefault(team_id, set()).add(q)
+            return q
+
+    def unsubscribe(self, team_id, q):
+        with self._lock:
+            streams = self._streams.get(team_id)
+            if streams:
+                streams.discard(q)
+                if not streams:
+                    del self._streams[team_id]
+
+    def publish(self, team_id, event, data):
+        with self._lock:
+            streams = list(self._streams.get(team_id, ()))
+            self.stats["published"] += 1
+        for q in streams:
+            try:
+                q.put_nowait((event, data))
+                self.stats["delivered"] += 1
+            except queue.Full:
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait(("resync", {}))
+                self.stats["resyncs"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {"teams": len(self._streams), "streams": sum(len(qs) for qs in self._streams.values()),
+                    **self.stats}
+
+
+events = EventHub()
+
+
+def _task_event(task):
+    return {k: task[k] for k in ("id", "task", "assigned_to", "priority", "status")}
+
+
+def publish_task_change(conn, team_id, op, task=None, task_id=None):
+    """Tell a team's open pages that a task was added/updated/deleted.
+
+    ``op="bulk"`` without a task covers imports and bulk actions.
+
+    Call after the commit; the diff carries the team_stats counters so the
+    dashboard cards update without another request.
+    """
+    if team_id is None:
+        return
+    data = {"op": op, "stats": team_stats(conn, team_id)}
+    if task is not None:
+        data["task"] = _task_event(task)
+    elif task_id is not None:
+        data["task"] = {"id": task_id}
+    events.publish(team_id, "task", data)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/events")
+@login_required()
+def event_stream():
+    team = current_team()
+    if not team:
+        return jsonify({"error": "no team"}), 404
+    team_id = team["id"]
+    q = events.subscribe(team_id)
+    if q is None:
+        # too many open streams: the page falls back to its normal reloads
+        return Response("too many live streams\n", status=503, headers={"Retry-After": "30"},
+                        mimetype="text/plain")
+
+    def stream():
+        try:
+            yield f"retry: {int(EVENT_HEARTBEAT * 1000)}\n\n"
+            while True:
+                try:
+                    event, data = q.get(timeout=EVENT_HEARTBEAT)
+                except queue.Empty:
+                    # comment line: keeps proxies from closing an idle stream and
+                    # surfaces a closed client as a write error here
+                    yield ": heartbeat\n\n"
+                    continue
+                yield _sse(event, data)
+        finally:
+            events.unsubscribe(team_id, q)
+
+    # the generator outlives the request, so it must not touch g.db
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 # ---------------- Landing / Role selection ----------------
 @app.route("/")
 def landing():
@@ -194,13 +2615,16 @@ def lead_register():
         existing = conn.execute("SELECT * FROM users WHERE username=?", (username,)).fetchone()
         if existing:
             flash("Username already exists", "danger")
-            conn.close()
             return redirect(url_for("lead_register"))
 
-        conn.execute("INSERT INTO users (username, display_name, password, role) VALUES (?, ?, ?, ?)",
-                     (username, display_name, password, "lead"))
-        conn.commit()
-        conn.close()
+        try:
+            conn.execute("INSERT INTO users (username, display_name, password, role) VALUES (?, ?, ?, ?)",
+                         (username, display_name, password, "lead"))
+            conn.commit()
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            flash("Username already exists", "danger")
+            return redirect(url_for("lead_register"))
         flash("Lead account created. Login now.", "success")
         return redirect(url_for("lead_login"))
     return render_template("lead_register.html")
@@ -213,7 +2637,6 @@ def lead_login():
         password = request.form.get("password").strip()
         conn = get_db()
         user = conn.execute("SELECT * FROM users WHERE username=? AND password=? AND role='lead'", (username, password)).fetchone()
-        conn.close()
         if user:
             session["user_id"] = user["id"]
             session["role"] = "lead"
@@ -244,30 +2667,30 @@ def member_join():
             return redirect(url_for("member_join"))
 
         conn = get_db()
-        # find team by member_code
-        team = conn.execute("SELECT * FROM teams WHERE team_code = substr(?, 1, instr(?, '-') - 1)", (member_code, member_code)).fetchone()
-        # fallback: try matching member_code in users table (if leads pre-created codes)
-        if not team:
-            # attempt to locate team by parsing before hyphen
-            code_part = member_code.split("-")[0]
-            team = conn.execute("SELECT * FROM teams WHERE team_code=?", (code_part,)).fetchone()
-
-        if not team:
-            flash("Invalid join code", "danger")
-            conn.close()
+        # claiming the code and creating the user commit together: the
+        # conditional UPDATE lets exactly one join redeem a code, and a
+        # failed insert rolls the claim back
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        claimed = conn.execute("UPDATE member_codes SET claimed_at=? WHERE code=? AND claimed_at IS NULL",
+                               (now, member_code)).rowcount == 1
+        if not claimed:
+            conn.rollback()
+            used = conn.execute("SELECT claimed_at FROM member_codes WHERE code=?", (member_code,)).fetchone()
+            flash("This join code is already used" if used else "Invalid join code", "danger")
             return redirect(url_for("member_join"))
+        # the UPDATE opened the transaction, so this reads the claimed row
+        team_id = conn.execute("SELECT team_id FROM member_codes WHERE code=?", (member_code,)).fetchone()["team_id"]
 
-        # check if member_code already used
-        exists = conn.execute("SELECT * FROM users WHERE member_code=?", (member_code,)).fetchone()
-        if exists:
-            flash("This join code is already used", "danger")
-            conn.close()
+        try:
+            cur = conn.execute("INSERT INTO users (username, display_name, password, role, team_id, member_code) VALUES (?, ?, ?, ?, ?, ?)",
+                               (username, display_name, password, "member", team_id, member_code))
+            conn.execute("UPDATE member_codes SET claimed_by=? WHERE code=?", (cur.lastrowid, member_code))
+            conn.commit()
+        except sqlite3.IntegrityError:
+            # username is unique-indexed
+            conn.rollback()
+            flash("Username already taken", "danger")
             return redirect(url_for("member_join"))
-
-        conn.execute("INSERT INTO users (username, display_name, password, role, team_id, member_code) VALUES (?, ?, ?, ?, ?, ?)",
-                     (username, display_name, password, "member", team["id"], member_code))
-        conn.commit()
-        conn.close()
         flash("Joined successfully. Login now.", "success")
         return redirect(url_for("member_login"))
     return render_template("member_join.html")
@@ -280,7 +2703,6 @@ def member_login():
         password = request.form.get("password").strip()
         conn = get_db()
         user = conn.execute("SELECT * FROM users WHERE username=? AND password=? AND role='member'", (username, password)).fetchone()
-        conn.close()
         if user:
             session["user_id"] = user["id"]
             session["role"] = "member"
@@ -305,18 +2727,20 @@ def create_team():
     user = current_user()
     if request.method == "POST":
         member_count = int(request.form.get("member_count", 1))
-        team_code = generate_team_code()
         conn = get_db()
+        # member codes are primary keys, so the team code must be unused
+        team_code = generate_team_code()
+        while conn.execute("SELECT 1 FROM teams WHERE team_code=?", (team_code,)).fetchone():
+            team_code = generate_team_code()
         cur = conn.cursor()
         cur.execute("INSERT INTO teams (team_code, lead_id, member_count) VALUES (?, ?, ?)",
                     (team_code, user["id"], member_count))
         team_id = cur.lastrowid
-        # generate member codes
+        forget_identity(("lead_team", user["id"]))
+        # store the member codes; members redeem them in member_join
         codes = create_member_codes(team_code, member_count)
-        # Save member_code placeholders in users table for tracking (optional)
-        # We do not create user rows yet; codes are shown to lead
+        cur.executemany("INSERT INTO member_codes (code, team_id) VALUES (?, ?)", [(code, team_id) for code in codes])
         conn.commit()
-        conn.close()
         return render_template("create_team_done.html", team_code=team_code, codes=codes)
     return render_template("create_team.html")
 
@@ -325,15 +2749,16 @@ def create_team():
 @login_required(role="lead")
 def lead_dashboard():
     user = current_user()
-    conn = get_db()
     # tasks for this lead's team(s) - assume lead has a team created
-    team = conn.execute("SELECT * FROM teams WHERE lead_id=?", (user["id"],)).fetchone()
+    team = current_team()
     team_id = team["id"] if team else None
-    tasks = []
-    if team_id:
-        tasks = conn.execute("SELECT * FROM tasks WHERE team_id=? ORDER BY id DESC", (team_id,)).fetchall()
-    conn.close()
-    return render_template("lead_dashboard.html", tasks=tasks, team=team, user=user)
+    conn = get_team_db(team_id)
+
+    def build():
+        page = fetch_task_page(conn, team_id)
+        return dict(tasks=page["tasks"], page=page, members=team_members(get_db(), team_id),
+                    stats=team_stats(conn, team_id), team=team, user=user)
+    return render_cached("lead_dashboard.html", team_id, build)
 
 
 # ---------------- Member Dashboard ----------------
@@ -341,13 +2766,16 @@ def lead_dashboard():
 @login_required(role="member")
 def member_dashboard():
     user = current_user()
-    conn = get_db()
-    # show tasks for user's team
-    tasks = conn.execute("SELECT * FROM tasks WHERE team_id=? ORDER BY id DESC", (user["team_id"],)).fetchall()
-    # show submissions by this member
-    submissions = conn.execute("SELECT * FROM submissions WHERE member_id=?", (user["id"],)).fetchall()
-    conn.close()
-    return render_template("member_dashboard.html", tasks=tasks, submissions=submissions, user=user)
+    conn = get_team_db(user["team_id"])
+
+    def build():
+        # show tasks for user's team, one page at a time
+        page = fetch_task_page(conn, user["team_id"])
+        members = team_members(get_db(), user["team_id"])
+        # show submissions by this member
+        submissions = conn.execute("SELECT * FROM submissions WHERE member_id=?", (user["id"],)).fetchall()
+        return dict(tasks=page["tasks"], page=page, members=members, submissions=submissions, user=user)
+    return render_cached("member_dashboard.html", user["team_id"], build)
 
 
 # ---------------- Submit GitHub Link ----------------
@@ -355,20 +2783,26 @@ def member_dashboard():
 @login_required(role="member")
 def submit_github(task_id):
     user = current_user()
+    conn = get_team_db(user["team_id"])
+    # only a task of the member's team that is assigned to them
+    task = conn.execute("SELECT * FROM tasks WHERE id=? AND team_id=? AND assigned_to=?",
+                        (task_id, user["team_id"], str(user["id"]))).fetchone()
+    if not task:
+        return "Task not found", 404
     if request.method == "POST":
         link = request.form.get("github_link", "").strip()
         created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        conn = get_db()
-        conn.execute("INSERT INTO submissions (task_id, member_id, github_link, submitted_on) VALUES (?, ?, ?, ?)",
-                     (task_id, user["id"], link, created))
-        conn.commit()
-        conn.close()
+        run_write(user["team_id"], lambda conn: conn.execute(
+            "INSERT INTO submissions (task_id, member_id, github_link, submitted_on, team_id) VALUES (?, ?, ?, ?, ?)",
+            (task_id, user["id"], link, created, user["team_id"])).lastrowid)
+        # tasks are unchanged, but the submission moved the team version on
+        snapshot_write(user["team_id"])
+        events.publish(user["team_id"], "submission",
+                       {"task_id": task_id, "member": user["display_name"] or user["username"],
+                        "github_link": link, "submitted_on": created})
         flash("Submitted link. Team Lead will review.", "success")
         return redirect(url_for("member_dashboard"))
     # GET -> show form
-    conn = get_db()
-    task = conn.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
-    conn.close()
     return render_template("submit_link.html", task=task)
 
 
@@ -377,16 +2811,24 @@ def submit_github(task_id):
 @login_required(role="member")
 def member_mark_done(task_id):
     user = current_user()
-    conn = get_db()
+    conn = get_team_db(user["team_id"])
     # Ensure task belongs to the member's team
     task = conn.execute("SELECT * FROM tasks WHERE id=? AND team_id=?", (task_id, user["team_id"])).fetchone()
     if not task:
-        conn.close()
         flash("Task not found or not allowed", "danger")
         return redirect(url_for("member_dashboard"))
-    conn.execute("UPDATE tasks SET status=? WHERE id=?", ("Done", task_id))
-    conn.commit()
-    conn.close()
+
+    done_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def mark_done(conn):
+        conn.execute(f"UPDATE tasks SET status=?, {SET_DONE_AT} WHERE id=?", ("Done", "Done", done_at, task_id))
+        refresh_task_risk(conn, [task_id])
+
+    run_write(user["team_id"], mark_done)
+    # as SET_DONE_AT does, a task that was already Done keeps its done_at
+    done_at = task["done_at"] if task["status"] == "Done" else done_at
+    snapshot_write(task["team_id"], TaskRecord.from_row(task, status="Done", done_at=done_at))
+    publish_task_change(conn, task["team_id"], "updated", task=dict(task, status="Done", done_at=done_at))
     flash("Marked done - team lead will review the submission.", "success")
     return redirect(url_for("member_dashboard"))
 
@@ -398,23 +2840,19 @@ def ai_chat():
     user = current_user()
     response_text = None
     error = None
+    job_id = None
     if request.method == "POST":
         question = request.form.get("question", "").strip()
         if question:
-            if GENAI and os.getenv("GEMINI_API_KEY"):
+            if ai_client.ready():
                 try:
-                    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-                    model_name = os.getenv("GEMINI_MODEL", "models/gemini-2.5-flash")
-                    model = genai.GenerativeModel(model_name)
-                    prompt = f"You are an assistant for students building projects. Answer concisely and help debug or suggest steps for: {question}"
-                    resp = model.generate_content(prompt)
-                    response_text = getattr(resp, "text", "") or str(resp)
-                except Exception as e:
-                    error = f"AI error: {e}"
+                    job_id = ai_jobs.submit(get_db(), "chat", chat_job(question), user_id=user["id"])
+                except AIQueueFull:
+                    error = "AI assistant is busy, please try again in a moment."
             else:
                 # fallback canned response
-                response_text = "AI not configured. Try asking about specific errors or steps (e.g., 'How to set up JWT auth in Flask?')."
-    return render_template("ai_chat.html", response=response_text, error=error)
+                response_text = CHAT_FALLBACK
+    return render_template("ai_chat.html", response=response_text, error=error, job_id=job_id)
 
 
 # ---------------- Keep existing core routes (task CRUD, AI suggestions, etc.) ----------------
@@ -423,10 +2861,12 @@ def ai_chat():
 @app.route("/add-task", methods=["GET", "POST"])
 def add_task():
     # Only team lead can add tasks
-    if session.get("role") != "lead":
-        return redirect(url_for("home"))
+    user = current_user()
+    if not user or user["role"] != "lead":
+        return redirect(url_for("home_for_role"))
 
-    conn = get_db()
+    team = current_team()
+    team_id = team["id"] if team else None
 
     if request.method == "POST":
         task = request.form.get("task", "").strip()
@@ -437,33 +2877,34 @@ def add_task():
 
         # Basic validation
         if not task or not assigned_user_id:
-            conn.close()
             return redirect(url_for("add_task"))
 
-        conn.execute("""
-            INSERT INTO tasks (task, assigned_to, priority, status, created_at, team_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (
-            task,
-            assigned_user_id,
-            priority,
-            status,
-            created,
-            session["team_id"]
-        ))
-
-        conn.commit()
-        conn.close()
+        def insert(conn):
+            cur = conn.execute("""
+                INSERT INTO tasks (task, assigned_to, priority, status, created_at, team_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                task,
+                assigned_user_id,
+                priority,
+                status,
+                created,
+                team_id
+            ))
+            refresh_task_risk(conn, [cur.lastrowid])
+            return cur.lastrowid
+
+        task_id = run_write(team_id, insert)
+        snapshot_write(team_id, TaskRecord(task_id, task, assigned_user_id, priority, status, created,
+                                            None, None, team_id, None))
+        publish_task_change(get_team_db(team_id), team_id, "added",
+                            task={"id": task_id, "task": task, "assigned_to": assigned_user_id,
+                                  "priority": priority, "status": status})
         return redirect(url_for("task_list"))
 
     # GET: load team members dynamically
-    members = conn.execute("""
-        SELECT id, display_name
-        FROM users
-        WHERE team_id=? AND role='member'
-    """, (session["team_id"],)).fetchall()
+    members = team_members(get_db(), team_id)
 
-    conn.close()
     return render_template("add_task.html", members=members)
 
 
@@ -476,19 +2917,19 @@ def task_list():
     conn = get_db()
     if user and user["role"] == "lead":
         # show tasks for lead's team
-        team = conn.execute("SELECT * FROM teams WHERE lead_id=?", (user["id"],)).fetchone()
+        team = current_team()
         team_id = team["id"] if team else None
-        if team_id:
-            tasks = conn.execute("SELECT * FROM tasks WHERE team_id=? ORDER BY id DESC", (team_id,)).fetchall()
-        else:
-            tasks = []
     elif user and user["role"] == "member":
-        tasks = conn.execute("SELECT * FROM tasks WHERE team_id=? ORDER BY id DESC", (user["team_id"],)).fetchall()
+        team_id = user["team_id"]
     else:
-        # show all tasks (for admins or general)
-        tasks = conn.execute("SELECT * FROM tasks ORDER BY id DESC").fetchall()
-    conn.close()
-    return render_template("task_list.html", tasks=tasks)
+        # show all tasks (for admins or general); not cached, it spans every team
+        page = fetch_task_page(conn, None, all_teams=True)
+        return render_template("task_list.html", tasks=page["tasks"], page=page, members=[])
+
+    def build():
+        page = fetch_task_page(get_team_db(team_id), team_id, archive=True)
+        return dict(tasks=page["tasks"], page=page, members=team_members(conn, team_id))
+    return render_cached("task_list.html", team_id, build)
 
 # AI SUGGESTIONS (Lead only) – generate tasks and allow assignment to members
 @app.route("/ai-suggestions", methods=["GET", "POST"])
@@ -502,63 +2943,35 @@ def ai_suggestions_lead():
     conn = get_db()
 
     # get team
-    team = conn.execute(
-        "SELECT * FROM teams WHERE lead_id=?",
-        (user["id"],)
-    ).fetchone()
+    team = current_team()
 
     team_id = team["id"] if team else None
 
     # load team members for dropdown
-    members = conn.execute("""
-        SELECT id, display_name
-        FROM users
-        WHERE team_id=? AND role='member'
-    """, (team_id,)).fetchall()
+    members = team_members(conn, team_id)
 
+    job_id = None
     if request.method == "POST":
         project_desc = request.form.get("project_desc", "").strip()
 
         if project_desc:
-            if GENAI and os.getenv("GEMINI_API_KEY"):
+            if ai_client.ready():
                 try:
-                    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-                    model = genai.GenerativeModel(
-                        os.getenv("GEMINI_MODEL", "models/gemini-2.5-flash")
-                    )
-
-                    prompt = f"""
-Return ONLY JSON in this format:
-{{ "tasks": ["task1","task2","task3","task4","task5","task6"] }}
+                    job_id = ai_jobs.submit(conn, "suggestions", suggestions_job(project_desc), user_id=user["id"])
+                except AIQueueFull:
+                    error = "AI is busy right now; showing default suggestions."
 
-Project: {project_desc}
-"""
-                    resp = model.generate_content(prompt)
-                    data = json.loads(resp.text)
-                    suggestions = data.get("tasks", [])
-
-                except Exception as e:
-                    error = f"AI error: {e}"
-
-            # fallback if AI fails
-            if not suggestions:
-                suggestions = [
-                    "Define project scope and requirements",
-                    "Design UI/UX wireframes",
-                    "Set up backend & database",
-                    "Implement core features and APIs",
-                    "Integrate AI and business logic",
-                    "Test, document and deploy"
-                ]
-
-    conn.close()
+            # fallback if AI is unavailable
+            if not job_id:
+                suggestions = SUGGESTIONS_FALLBACK
 
     return render_template(
         "ai_suggestion.html",
         suggestions=suggestions,
         members=members,
         project_desc=project_desc,
-        error=error
+        error=error,
+        job_id=job_id
     )
 
 
@@ -572,24 +2985,20 @@ def add_suggestion_lead():
     if not text or not assigned_to:
         return redirect(url_for("ai_suggestions_lead"))
 
-    user = current_user()
-    conn = get_db()
-
-    team = conn.execute(
-        "SELECT * FROM teams WHERE lead_id=?",
-        (user["id"],)
-    ).fetchone()
+    team = current_team()
 
     team_id = team["id"] if team else None
     created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    conn.execute("""
-        INSERT INTO tasks (task, assigned_to, priority, status, created_at, team_id)
-        VALUES (?, ?, 'Medium', 'To-Do', ?, ?)
-    """, (text, assigned_to, created, team_id))
+    def insert(conn):
+        cur = conn.execute("""
+            INSERT INTO tasks (task, assigned_to, priority, status, created_at, team_id)
+            VALUES (?, ?, 'Medium', 'To-Do', ?, ?)
+        """, (text, assigned_to, created, team_id))
+        refresh_task_risk(conn, [cur.lastrowid])
+        return cur.lastrowid
 
-    conn.commit()
-    conn.close()
+    run_write(team_id, insert)
 
     return redirect(url_for("lead_dashboard"))
 
@@ -600,79 +3009,70 @@ def add_suggestion_lead():
 @login_required(role="lead")
 def ai_subtasks_lead(task_id):
     # same as earlier but only for lead
-    conn = get_db()
-    task = conn.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
-    conn.close()
+    team_id = current_team_id()
+    if team_id is None:
+        return "No team", 404
+    conn = get_team_db(team_id)
+    task = conn.execute("SELECT * FROM tasks WHERE id=? AND team_id=?", (task_id, team_id)).fetchone()
     if not task:
         flash("Task not found", "danger")
         return redirect(url_for("lead_dashboard"))
 
-    suggestions = []
+    suggestions = ai_cache.get(conn, "subtasks", task["task"]) or []
     error = None
-    if GENAI and os.getenv("GEMINI_API_KEY"):
+    job_id = None
+    if not suggestions and ai_client.ready():
         try:
-            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-            model_name = os.getenv("GEMINI_MODEL", "models/gemini-2.5-flash")
-            model = genai.GenerativeModel(model_name)
-            prompt = f"""
-You are an expert software engineer. Break the following task into a JSON object with key "subtasks" containing 5 detailed subtasks (each short and actionable). Return ONLY the JSON.
-
-Task: {task['task']}
-
-Exact format:
-{{ "subtasks": ["subtask1", "subtask2", "subtask3", "subtask4", "subtask5"] }}
-"""
-            resp = model.generate_content(prompt)
-            text = getattr(resp, "text", "") or str(resp)
-            data = json.loads(text)
-            if isinstance(data, dict) and "subtasks" in data and isinstance(data["subtasks"], list):
-                suggestions = data["subtasks"]
-        except Exception as e:
-            error = f"AI error: {e}"
-    if not suggestions:
-        suggestions = [
-            "Analyze requirements and acceptance criteria",
-            "Create module-level design and diagrams",
-            "Implement core logic and endpoints",
-            "Write unit and integration tests",
-            "Run manual tests and deploy to staging"
-        ]
-    return render_template("ai_subtasks.html", task=task, suggestions=suggestions, error=error)
+            job_id = ai_jobs.submit(get_db(), "subtasks", subtasks_job(task["id"], task["task"]),
+                                    user_id=session.get("user_id"), task_id=task["id"], team_id=team_id)
+        except AIQueueFull:
+            error = "AI is busy right now; showing default subtasks."
+    if not suggestions and not job_id:
+        suggestions = SUBTASKS_FALLBACK
+    return render_template("ai_subtasks.html", task=task, suggestions=suggestions, error=error, job_id=job_id)
 
 
 # Explain task (both lead and member can view explanation)
 @app.route("/explain/<int:task_id>")
+@login_required()
 def explain_task_shared(task_id):
-    conn = get_db()
-    task = conn.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
-    conn.close()
+    team_id = current_team_id()
+    if team_id is None:
+        return "Task not found", 404
+    conn = get_team_db(team_id)
+    task = conn.execute("SELECT * FROM tasks WHERE id=? AND team_id=?", (task_id, team_id)).fetchone()
     if not task:
         return "Task not found", 404
-    explanation = ""
+    explanation = ai_cache.get(conn, "explain", task["task"]) or ""
     error = None
-    if GENAI and os.getenv("GEMINI_API_KEY"):
+    job_id = None
+    if not explanation and ai_client.ready():
         try:
-            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-            model_name = os.getenv("GEMINI_MODEL", "models/gemini-2.5-flash")
-            model = genai.GenerativeModel(model_name)
-            prompt = f"Explain this task in 3 short sentences: {task['task']}"
-            resp = model.generate_content(prompt)
-            explanation = getattr(resp, "text", "") or str(resp)
-        except Exception as e:
-            error = f"AI error: {e}"
-    if not explanation:
-        explanation = f"Fallback: This task '{task['task']}' should be broken into subtasks and implemented based on priority."
-    return render_template("task_explanation.html", task=task, explanation=explanation, error=error)
+            job_id = ai_jobs.submit(get_db(), "explain", explain_job(task["id"], task["task"]),
+                                    user_id=session.get("user_id"), task_id=task["id"], team_id=team_id)
+        except AIQueueFull:
+            error = "AI is busy right now; showing a default explanation."
+    if not explanation and not job_id:
+        explanation = EXPLAIN_FALLBACK.format(task=task["task"])
+    return render_template("task_explanation.html", task=task, explanation=explanation, error=error,
+                           job_id=job_id)
 
 
 # update-status (lead can update statuses; members use member-mark-done route)
 @app.route("/update-status/<int:task_id>/<string:new_status>")
 @login_required(role="lead")
 def update_status_lead(task_id, new_status):
-    conn = get_db()
-    conn.execute("UPDATE tasks SET status=? WHERE id=?", (new_status, task_id))
+    team = current_team()
+    conn = get_team_db(team["id"] if team else None)
+    changed = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cur = conn.execute(f"UPDATE tasks SET status=?, {SET_DONE_AT} WHERE id=? AND team_id=?",
+                       (new_status, new_status, changed, task_id, team["id"] if team else None))
+    refresh_task_risk(conn, [task_id])
     conn.commit()
-    conn.close()
+    if cur.rowcount:
+        task = conn.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
+        snapshot_write(team["id"], TaskRecord.from_row(task))
+        publish_task_change(conn, team["id"], "updated", task=task)
     flash("Status updated", "success")
     return redirect(url_for("lead_dashboard"))
 
@@ -680,88 +3080,578 @@ def update_status_lead(task_id, new_status):
 @app.route("/delete-task/<int:task_id>")
 @login_required(role="lead")
 def delete_task_lead(task_id):
-    conn = get_db()
-    conn.execute("DELETE FROM tasks WHERE id=?", (task_id,))
+    team = current_team()
+    conn = get_team_db(team["id"] if team else None)
+    deleted = delete_tasks(conn, team["id"] if team else None, [task_id])
+    refresh_task_risk(conn, [task_id])
     conn.commit()
-    conn.close()
+    if deleted:
+        snapshot_write(team["id"], deleted_id=task_id)
+        publish_task_change(conn, team["id"], "deleted", task_id=task_id)
     flash("Task deleted", "success")
     return redirect(url_for("lead_dashboard"))
 
 
-# Delay prediction route (shared)
+# ---------------- Bulk task actions (lead only) ----------------
+BULK_CHUNK = 500  # stays well under SQLite's bound-parameter limit
+
+
+def bulk_task_ids(conn, team_id, form):
+    """Resolve the tasks a bulk action targets, always within ``team_id``.
+
+    Either explicit ``ids`` (ids from other teams simply never match) or a
+    filter: ``status`` and/or ``older_than`` days on ``created_at`` (on when
+    the task was marked Done, for ``status=Done``).
+    """
+    ids = [int(i) for i in form.getlist("ids") if str(i).isdigit()]
+    if ids:
+        return ids
+    status = form.get("status")
+    older_than = form.get("older_than", "")
+    if status not in STATUSES and not older_than.isdigit():
+        return []
+    sql, params = "SELECT id FROM tasks WHERE team_id=?", [team_id]
+    if status in STATUSES:
+        sql += " AND status=?"
+        params.append(status)
+    if older_than.isdigit():
+        cutoff = datetime.now() - timedelta(days=int(older_than))
+        sql += " AND COALESCE(done_at, created_at) < ?" if status == "Done" else " AND created_at < ?"
+        params.append(cutoff.strftime("%Y-%m-%d %H:%M:%S"))
+    return [r[0] for r in conn.execute(sql, params)]
+
+
+def delete_tasks(conn, team_id, ids):
+    """Delete ``team_id``'s tasks among ``ids`` with their submissions and ai_cache rows; returns tasks deleted.
+
+    Runs inside the caller's transaction; at most BULK_CHUNK ids per call.
+    """
+    marks = ",".join("?" * len(ids))
+    owned = f"SELECT id FROM tasks WHERE team_id=? AND id IN ({marks})"
+    conn.execute(f"DELETE FROM submissions WHERE task_id IN ({owned})", [team_id, *ids])
+    conn.execute(f"DELETE FROM ai_cache WHERE task_id IN ({owned})", [team_id, *ids])
+    return conn.execute(f"DELETE FROM tasks WHERE team_id=? AND id IN ({marks})", [team_id, *ids]).rowcount
+
+
+def bulk_apply(conn, team_id, ids, new_status=None):
+    """Set ``new_status`` on (or, without one, delete) ``ids`` in one transaction.
+
+    Ids go in BULK_CHUNK at a time and task_risk is refreshed before the
+    single commit; team_stats follows through its triggers. Returns the
+    number of rows changed.
+    """
+    affected = 0
+    changed = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for start in range(0, len(ids), BULK_CHUNK):
+            chunk = ids[start:start + BULK_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            if new_status:
+                cur = conn.execute(f"UPDATE tasks SET status=?, {SET_DONE_AT} "
+                                   f"WHERE team_id=? AND id IN ({marks}) AND status IS NOT ?",
+                                   [new_status, new_status, changed, team_id, *chunk, new_status])
+                affected += cur.rowcount
+            else:
+                affected += delete_tasks(conn, team_id, chunk)
+        refresh_task_risk(conn, ids)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return affected
+
+
+@app.route("/bulk/status", methods=["POST"])
+@login_required(role="lead")
+def bulk_status_lead():
+    new_status = request.form.get("new_status")
+    if new_status not in STATUSES:
+        if wants_json():
+            return jsonify({"error": "new_status must be one of " + ", ".join(STATUSES)}), 400
+        flash("Pick a valid status", "warning")
+        return redirect(url_for("lead_dashboard"))
+    team_id = current_team_id()
+    conn = get_team_db(team_id)
+    ids = bulk_task_ids(conn, team_id, request.form)
+    updated = bulk_apply(conn, team_id, ids, new_status) if ids else 0
+    if updated:
+        publish_task_change(conn, team_id, "bulk")
+    if wants_json():
+        return jsonify({"selected": len(ids), "updated": updated})
+    flash(f"{updated} task(s) set to {new_status}", "success")
+    return redirect(url_for("lead_dashboard"))
+
+
+@app.route("/bulk/delete", methods=["POST"])
+@login_required(role="lead")
+def bulk_delete_lead():
+    team_id = current_team_id()
+    conn = get_team_db(team_id)
+    ids = bulk_task_ids(conn, team_id, request.form)
+    deleted = bulk_apply(conn, team_id, ids) if ids else 0
+    if deleted:
+        publish_task_change(conn, team_id, "bulk")
+    if wants_json():
+        return jsonify({"selected": len(ids), "deleted": deleted})
+    flash(f"{deleted} task(s) deleted", "success")
+    return redirect(url_for("lead_dashboard"))
+
+
+# Delay prediction route (shared by lead and members, scoped to their team)
 @app.route("/delay-prediction")
+@login_required()
 def delay_prediction_shared():
-    conn = get_db()
-    tasks = conn.execute("SELECT * FROM tasks ORDER BY id DESC").fetchall()
-    conn.close()
-    predictions = []
-    for t in tasks:
-        if t["priority"] == "High" and t["status"] != "Done":
-            pred = "High Delay Risk"
-        elif t["status"] == "In Progress":
-            pred = "Possibly Delayed"
-        else:
-            pred = "On Track"
-        predictions.append({"task": t["task"], "assigned_to": t["assigned_to"], "priority": t["priority"], "status": t["status"], "prediction": pred})
-    # For role-based view, the template can filter
-    return render_template("delay_prediction.html", predictions=predictions)
+    team_id = current_team_id()
+    conn = get_team_db(team_id)
+    # risk comes precomputed from task_risk; only one page of it is read
+    page = fetch_task_page(conn, team_id, with_risk=True)
+    stats = team_stats(conn, team_id)
+    return render_template("delay_prediction.html", predictions=page["tasks"], page=page,
+                           todo=stats["todo"], progress=stats["in_progress"], done=stats["done"])
+
+
+# ---------------- Archive (cold tasks) ----------------
+# Tasks marked Done more than ARCHIVE_AFTER_DAYS ago (done_at; created_at for
+# rows from before the column existed) move, with their submissions, to tasks_archive and
+# submissions_archive - in each shard's own file when sharded. The hot tables,
+# and every index, counter and search entry kept over them, then hold only the
+# working set; ?archived=1 on the task list and the export reads both.
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "500"))
+# SET clause for status writes, bound as (new status, now): stamps done_at when
+# a task becomes Done, keeps it while it stays Done and clears it otherwise
+SET_DONE_AT = "done_at = CASE WHEN ? IS NOT 'Done' THEN NULL WHEN status IS 'Done' THEN done_at ELSE ? END"
+
+
+def archive_done_tasks(conn, cutoff, batch_size=ARCHIVE_BATCH):
+    """Move tasks marked Done before ``cutoff`` into the archive tables.
+
+    Each batch of ``batch_size`` tasks is its own BEGIN IMMEDIATE transaction,
+    so request writes get the lock between batches. The delete triggers keep
+    team_stats, the search index and team versions in step, and task_risk
+    rows go with the tasks. Returns (tasks, submissions) moved.
+    """
+    moved_tasks = moved_submissions = 0
+    task_cols, submission_cols = _columns(conn, "tasks"), _columns(conn, "submissions")
+    after_id = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [r[0] for r in conn.execute(
+                "SELECT id FROM tasks WHERE status='Done' AND COALESCE(done_at, created_at) < ? AND id > ? "
+                "ORDER BY id LIMIT ?",
+                (cutoff, after_id, batch_size))]
+            if not ids:
+                conn.rollback()
+                return moved_tasks, moved_submissions
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            marks = ",".join("?" * len(ids))
+            conn.execute(f"INSERT INTO tasks_archive ({task_cols}, archived_at) "
+                         f"SELECT {task_cols}, ? FROM tasks WHERE id IN ({marks})", [now, *ids])
+            moved_submissions += conn.execute(
+                f"INSERT INTO submissions_archive ({submission_cols}, archived_at) "
+                f"SELECT {submission_cols}, ? FROM submissions WHERE task_id IN ({marks})", [now, *ids]).rowcount
+            conn.execute(f"DELETE FROM submissions WHERE task_id IN ({marks})", ids)
+            conn.execute(f"DELETE FROM tasks WHERE id IN ({marks})", ids)
+            refresh_task_risk(conn, ids)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        moved_tasks += len(ids)
+        after_id = ids[-1]
+
+
+@app.cli.command("archive")
+@click.option("--days", type=int, default=ARCHIVE_AFTER_DAYS, show_default=True,
+              help="archive tasks marked Done more than this many days ago")
+@click.option("--batch", type=int, default=ARCHIVE_BATCH, show_default=True, help="tasks moved per transaction")
+def archive_command(days, batch):
+    """Move old Done tasks and their submissions to the archive tables (every shard too)."""
+    ensure_schema()
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    tasks = submissions = 0
+    for pool in database_pools():
+        conn = pool.acquire()
+        try:
+            moved = archive_done_tasks(conn, cutoff, batch)
+        finally:
+            pool.release(conn)
+        tasks, submissions = tasks + moved[0], submissions + moved[1]
+    click.echo(f"archived {tasks} tasks and {submissions} submissions done before {cutoff}")
+
+
+# ---------------- Export (lead only) ----------------
+EXPORT_BATCH = 1000
+EXPORT_FIELDS = ["id", "task", "assigned_to", "priority", "status", "created_at", "sub_tasks"]
+EXPORT_HEADER = ["ID", "Task", "Assigned", "Priority", "Status", "Created", "Subtasks"]
+EXPORT_FORMATS = {
+    # format: (file extension, mimetype, needs pyarrow)
+    "csv": ("csv", "text/csv", False),
+    "ndjson": ("ndjson", "application/x-ndjson", False),
+    "parquet": ("parquet", "application/vnd.apache.parquet", True),
+    "arrow": ("arrows", "application/vnd.apache.arrow.stream", True),
+}
+
+
+def iter_task_batches(team_id, batch_size=EXPORT_BATCH, archived=False):
+    """Yield lists of a team's task rows (EXPORT_FIELDS order), newest first.
+
+    Runs on its own pooled connection because it is consumed while the
+    response streams, after the request's app context is gone. ``archived``
+    merges in tasks_archive, both tables streamed in id order.
+    """
+    if not team_id:
+        return
+    pool = team_pool(team_id)
+    conn = pool.acquire()
+    tables = ("tasks", "tasks_archive") if archived else ("tasks",)
+    cursors = [conn.execute(f"SELECT {', '.join(EXPORT_FIELDS)} FROM {table} WHERE team_id=? ORDER BY id DESC",
+                            (team_id,)) for table in tables]
+    rows = heapq.merge(*cursors, key=lambda r: r[0], reverse=True)
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            yield batch
+    finally:
+        for cur in cursors:
+            cur.close()
+        pool.release(conn)
+
+
+def _csv_chunks(batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_HEADER)
+    yield buf.getvalue().encode()
+    for rows in batches:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+
+
+def _ndjson_chunks(batches):
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(EXPORT_FIELDS, r))) + "\n" for r in rows).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that buffers whatever pyarrow writes until drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_chunks(batches, fmt):
+    import pyarrow as pa
+    schema = pa.schema([(name, pa.int64() if name == "id" else pa.string()) for name in EXPORT_FIELDS])
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    for rows in batches:
+        columns = list(zip(*rows))
+        writer.write_batch(pa.record_batch(
+            [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _gzip_chunks(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
 
 
-# Export CSV (lead only)
 @app.route("/export-csv")
 @login_required(role="lead")
 def export_csv_lead():
-    user = current_user()
-    conn = get_db()
-    team = conn.execute("SELECT * FROM teams WHERE lead_id=?", (user["id"],)).fetchone()
-    tasks = []
-    if team:
-        tasks = conn.execute("SELECT * FROM tasks WHERE team_id=? ORDER BY id DESC", (team["id"],)).fetchall()
-    conn.close()
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["ID", "Task", "Assigned", "Priority", "Status", "Created", "Subtasks"])
-    for t in tasks:
-        writer.writerow([t["id"], t["task"], t["assigned_to"], t["priority"], t["status"], t["created_at"], t["sub_tasks"]])
-    mem = io.BytesIO(output.getvalue().encode())
-    mem.seek(0)
-    return send_file(mem, mimetype="text/csv", download_name="tasks.csv", as_attachment=True)
+    """Stream the team's tasks as csv (default), ndjson, parquet or arrow.
+
+    Rows are read and encoded EXPORT_BATCH at a time, so memory stays flat
+    and the first bytes go out immediately (chunked transfer encoding).
+    ``?gzip=1`` compresses the stream on the fly and ``?archived=1`` includes
+    archived tasks.
+    """
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in EXPORT_FORMATS:
+        flash(f"Unknown export format '{fmt}'", "warning")
+        return redirect(url_for("lead_dashboard"))
+    ext, mimetype, needs_arrow = EXPORT_FORMATS[fmt]
+    if needs_arrow and importlib.util.find_spec("pyarrow") is None:
+        flash(f"{fmt} export needs pyarrow installed", "warning")
+        return redirect(url_for("lead_dashboard"))
+
+    team = current_team()
+    batches = iter_task_batches(team["id"] if team else None,
+                                archived=request.args.get("archived") in ("1", "true", "yes"))
+
+    if fmt == "csv":
+        chunks = _csv_chunks(batches)
+    elif fmt == "ndjson":
+        chunks = _ndjson_chunks(batches)
+    else:
+        chunks = _arrow_chunks(batches, fmt)
+    filename = f"tasks.{ext}"
+    if request.args.get("gzip") in ("1", "true", "yes"):
+        chunks = _gzip_chunks(chunks)
+        filename += ".gz"
+        mimetype = "application/gzip"
+    return Response(chunks, mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+# ---------------- Bulk import (lead only) ----------------
+IMPORT_BATCH = 1000
+IMPORT_MAX_ERRORS = 100
+# accepted column names (export headers or tasks columns) -> tasks column
+IMPORT_COLUMNS = {
+    "task": "task",
+    "assigned": "assigned_to", "assigned_to": "assigned_to",
+    "priority": "priority",
+    "status": "status",
+    "created": "created_at", "created_at": "created_at",
+    "subtasks": "sub_tasks", "sub_tasks": "sub_tasks",
+}
+IMPORT_DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+
+def _iter_json_array(stream, chunk_size=1 << 16):
+    """Yield the objects of a top-level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    buf, pos, eof, started = "", 0, False, False
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                raise ValueError("unexpected end of JSON array")
+            buf, pos = stream.read(chunk_size), 0
+            eof = not buf
+            continue
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("expected a JSON array of task objects")
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+            # a number or literal cut at the end of the buffer may go on in the next chunk
+            truncated = end == len(buf) and not eof
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            truncated = True
+        if truncated:
+            more = stream.read(chunk_size)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+            continue
+        # items that are not objects are rejected per row by _import_row
+        yield obj
+        pos = end
+
+
+def iter_import_records(upload, fmt):
+    """Yield dicts from an uploaded csv, ndjson or json file, reading it incrementally."""
+    text = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        yield from csv.DictReader(text)
+    elif fmt == "ndjson":
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from _iter_json_array(text)
+
+
+def _import_timestamp(value):
+    """``value`` as a tasks.created_at string, or None if it is not a timestamp."""
+    for fmt in IMPORT_DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            pass
+    return None
+
+
+def _import_row(record, assignees, now):
+    """Validate one record; return (tasks row tuple, None) or (None, error)."""
+    if not isinstance(record, dict):
+        return None, "not an object"
+    values = {}
+    for key, value in record.items():
+        column = IMPORT_COLUMNS.get(str(key).strip().lower())
+        if column:
+            values[column] = value
+    # every column but sub_tasks is text; numbers are taken as written
+    for column, value in values.items():
+        if column == "sub_tasks" or value is None or isinstance(value, str):
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[column] = str(value)
+        else:
+            return None, f"invalid {column} {value!r}"
+    task = (values.get("task") or "").strip()
+    if not task:
+        return None, "missing task text"
+    assignee = assignees.get((values.get("assigned_to") or "").strip())
+    if assignee is None:
+        return None, f"unknown assignee {values.get('assigned_to')!r}"
+    priority = values.get("priority") or "Medium"
+    if priority not in PRIORITIES:
+        return None, f"invalid priority {priority!r}"
+    status = values.get("status") or "To-Do"
+    if status not in STATUSES:
+        return None, f"invalid status {status!r}"
+    created_at = now
+    if values.get("created_at"):
+        created_at = _import_timestamp(values["created_at"])
+        if created_at is None:
+            return None, f"invalid created_at {values['created_at']!r}"
+    sub_tasks = values.get("sub_tasks")
+    if isinstance(sub_tasks, list):
+        sub_tasks = json.dumps(sub_tasks)
+    elif sub_tasks is not None and not isinstance(sub_tasks, str):
+        return None, f"invalid sub_tasks {sub_tasks!r} (expected text or a list)"
+    return (task, str(assignee), priority, status, created_at, sub_tasks or None), None
+
+
+def import_tasks(conn, team_id, records, catalog=None):
+    """Insert validated records for a team in one transaction.
+
+    Assignees are resolved against the team's members (by id or username) in
+    a single query on ``catalog`` (default: ``conn``), rows go in with
+    executemany IMPORT_BATCH at a time, and every rejected row is reported
+    with its 1-based row number.
+    """
+    assignees = {}
+    for m in (catalog or conn).execute("SELECT id, username FROM users WHERE team_id=? AND role='member'", (team_id,)):
+        assignees[str(m["id"])] = m["id"]
+        assignees[m["username"]] = m["id"]
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    sql = """
+        INSERT INTO tasks (task, assigned_to, priority, status, created_at, sub_tasks, team_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """
+    inserted, errors, error_count, batch = 0, [], 0, []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        last_id = conn.execute("SELECT IFNULL(MAX(id), 0) FROM tasks").fetchone()[0]
+        row_no = 0
+        try:
+            for row_no, record in enumerate(records, start=1):
+                row, error = _import_row(record, assignees, now)
+                if error:
+                    error_count += 1
+                    if len(errors) < IMPORT_MAX_ERRORS:
+                        errors.append({"row": row_no, "error": error})
+                    continue
+                batch.append(row + (team_id,))
+                if len(batch) >= IMPORT_BATCH:
+                    conn.executemany(sql, batch)
+                    inserted += len(batch)
+                    batch = []
+        except (ValueError, csv.Error) as e:
+            # the rest of the file is unreadable; keep what parsed cleanly
+            error_count += 1
+            errors.append({"row": row_no + 1, "error": f"parse error: {e}"})
+        if batch:
+            conn.executemany(sql, batch)
+            inserted += len(batch)
+        refresh_task_risk(conn, team_id=team_id, after_id=last_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"inserted": inserted, "failed": error_count, "errors": errors}
+
+
+@app.route("/import-tasks", methods=["GET", "POST"])
+@login_required(role="lead")
+def import_tasks_lead():
+    result = None
+    if request.method == "POST":
+        team = current_team()
+        upload = request.files.get("file")
+        if not team or not upload or not upload.filename:
+            flash("Choose a file to import", "warning")
+            return redirect(url_for("import_tasks_lead"))
+        fmt = request.form.get("format") or upload.filename.rsplit(".", 1)[-1].lower()
+        if fmt not in ("csv", "json", "ndjson"):
+            flash("Upload a .csv, .json or .ndjson file", "warning")
+            return redirect(url_for("import_tasks_lead"))
+        started = time.perf_counter()
+        conn = get_team_db(team["id"])
+        result = import_tasks(conn, team["id"], iter_import_records(upload, fmt), catalog=get_db())
+        if result["inserted"]:
+            publish_task_change(conn, team["id"], "bulk")
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        if wants_json():
+            return jsonify(result)
+    return render_template("import_tasks.html", result=result)
+
+
 @app.route("/profile")
 def profile():
-    if "user_id" not in session:
+    user = current_user()
+    if not user:
         return redirect("/")
 
-    role = session.get("role")
-    team_id = session.get("team_id")
-
     conn = get_db()
 
-    if role == "lead":
-        team = conn.execute(
-            "SELECT * FROM teams WHERE id=?",
-            (team_id,)
-        ).fetchone()
+    if user["role"] == "lead":
+        team = current_team()
+        team_id = team["id"] if team else None
 
         members = conn.execute(
             "SELECT display_name, username FROM users WHERE team_id=? AND role='member'",
             (team_id,)
         ).fetchall()
+        codes = conn.execute(
+            "SELECT code, claimed_at, display_name FROM member_codes LEFT JOIN users ON users.id = claimed_by "
+            "WHERE member_codes.team_id=? ORDER BY code",
+            (team_id,)
+        ).fetchall()
 
-        conn.close()
         return render_template(
             "profile_lead.html",
             team=team,
-            members=members
+            members=members,
+            codes=codes
         )
 
     else:
-        user = conn.execute(
-            "SELECT * FROM users WHERE id=?",
-            (session["user_id"],)
-        ).fetchone()
-
-        conn.close()
         return render_template(
             "profile_member.html",
             user=user
@@ -772,8 +3662,7 @@ def logout():
     return redirect("/")
 
 
-
 # ---------------- Run App ----------------
 if __name__ == "__main__":
-    app.run(debug=True)
+    init_app().run(debug=True)
  
\ No newline at end of file
@@ -0,0 +1,10 @@
+"""Reproducible benchmarks for Taskify.
+
+    python -m bench seed --db /tmp/bench.db --teams 20 --tasks 2000
+    python -m bench run --db /tmp/bench.db --duration 30 --concurrency 8
+    python -m bench compare bench/results/a.json bench/results/b.json
+    python -m bench startup --budget-ms 500
+
+The database path is handed to the app through DATABASE_URL, so ``app`` is
+only imported after the command line has been parsed.
+"""
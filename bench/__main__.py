@@ -0,0 +1,153 @@
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+from bench import datagen, driver, report, startup
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def fresh_database(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def load_app(db_path):
+    # DB_PATH is read when app is imported; init_app() applies the migrations
+    os.environ["DATABASE_URL"] = db_path
+    import app
+    app.init_app()
+    return app
+
+
+def seed(app, args):
+    conn = app.db_pool.acquire()
+    try:
+        counts = datagen.generate(conn, teams=args.teams, members=args.members, tasks=args.tasks,
+                                  submissions=args.submissions, seed=args.seed)
+        app.refresh_task_risk(conn)
+        conn.commit()
+    finally:
+        app.db_pool.release(conn)
+    return counts
+
+
+def detect_shape(db_path):
+    """(teams, members per team, tasks per team) of a datagen database."""
+    conn = sqlite3.connect(db_path)
+    try:
+        teams = conn.execute("SELECT COUNT(*) FROM teams").fetchone()[0] or 1
+        members = conn.execute("SELECT COUNT(*) FROM users WHERE role='member'").fetchone()[0] // teams
+        tasks = conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] // teams
+    finally:
+        conn.close()
+    return teams, members, tasks
+
+
+def cmd_seed(args):
+    fresh_database(args.db)
+    counts = seed(load_app(args.db), args)
+    print(f"seeded {args.db}: " + ", ".join(f"{v} {k}" for k, v in counts.items()))
+
+
+def cmd_run(args):
+    app = None
+    if args.url:
+        teams, members, tasks = args.teams, args.members, args.tasks
+    else:
+        if not args.keep_db:
+            fresh_database(args.db)
+        app = load_app(args.db)
+        if not args.keep_db:
+            seed(app, args)
+        teams, members, tasks = detect_shape(args.db)
+        app.app.logger.setLevel("WARNING")
+    recorder, wall = driver.run(app=app.app if app else None, base_url=args.url, teams=teams, members=members,
+                                tasks_per_team=tasks, duration=args.duration, requests=args.requests,
+                                concurrency=args.concurrency, member_share=args.member_share, seed=args.seed,
+                                warmup=args.warmup)
+    params = {k: v for k, v in vars(args).items() if k not in ("func", "out")}
+    params.update(teams=teams, members=members, tasks=tasks, transport="http" if args.url else "test_client")
+    result = report.summarize(recorder, wall, params)
+    print(report.format_table(result))
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(RESULTS_DIR, f"{stamp}-{result['commit'] or 'nogit'}.json")
+    report.save(result, out)
+    print(f"saved {out}")
+
+
+def cmd_startup(args):
+    fresh_database(args.db)
+    try:
+        first, samples = startup.measure(args.db, args.repeat)
+        imports = startup.slowest_imports(args.db, args.top) if args.top else ()
+    finally:
+        fresh_database(args.db)
+    result = startup.summarize(first, samples, args.budget_ms)
+    print(startup.format_result(result, imports))
+    if args.out:
+        report.save(dict(result, commit=report.git_commit()), args.out)
+        print(f"saved {args.out}")
+    return 0 if result["within_budget"] else 1
+
+
+def cmd_compare(args):
+    print(report.compare(report.load(args.old), report.load(args.new)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Taskify benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def data_options(p):
+        p.add_argument("--teams", type=int, default=10)
+        p.add_argument("--members", type=int, default=5, help="members per team")
+        p.add_argument("--tasks", type=int, default=500, help="tasks per team")
+        p.add_argument("--submissions", type=int, default=100, help="submissions per team")
+        p.add_argument("--seed", type=int, default=1)
+
+    p = sub.add_parser("seed", help="create a fresh synthetic database")
+    p.add_argument("--db", required=True)
+    data_options(p)
+    p.set_defaults(func=cmd_seed)
+
+    p = sub.add_parser("run", help="seed a fresh database (unless --keep-db) and replay the route mix")
+    p.add_argument("--db", default="bench.db")
+    p.add_argument("--keep-db", action="store_true", help="reuse --db as it is instead of reseeding it")
+    p.add_argument("--url", help="drive a running server over HTTP instead of the test client; "
+                                 "seed its database with the same --teams/--members/--tasks first")
+    data_options(p)
+    p.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    p.add_argument("--requests", type=int, help="stop after this many requests instead")
+    p.add_argument("--concurrency", type=int, default=4)
+    p.add_argument("--member-share", type=float, default=0.6, help="fraction of workers that are members")
+    p.add_argument("--warmup", type=int, default=20, help="unrecorded requests per worker")
+    p.add_argument("--out", help="report path (default: bench/results/<time>-<commit>.json)")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("startup", help="time import, init_app() and first request in fresh processes")
+    p.add_argument("--db", default="bench-startup.db", help="scratch database, deleted afterwards")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--budget-ms", type=float, default=500.0,
+                   help="exit 1 when median import + init_app() time exceeds this")
+    p.add_argument("--top", type=int, default=10, help="list this many slowest imports (0: skip)")
+    p.add_argument("--out", help="also save the result as JSON here")
+    p.set_defaults(func=cmd_startup)
+
+    p = sub.add_parser("compare", help="compare two saved reports")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
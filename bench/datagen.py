@@ -0,0 +1,79 @@
+"""Seeded synthetic data: teams, members, tasks and submissions.
+
+Rows go straight into SQLite (the app's migrations create the schema and its
+triggers maintain team_stats, the search index and team versions), so a run
+with the same arguments and seed always produces the same database.
+"""
+import random
+from datetime import datetime, timedelta
+
+PASSWORD = "bench"
+VERBS = ["Fix", "Add", "Refactor", "Document", "Test", "Review", "Optimize", "Migrate", "Design", "Deploy"]
+OBJECTS = ["login flow", "task export", "dashboard", "API client", "search index", "billing page",
+           "CI pipeline", "database schema", "onboarding emails", "settings screen", "audit log",
+           "notification service", "file upload", "access control", "caching layer"]
+DETAILS = ["for mobile", "before release", "with retries", "for large teams", "behind a flag",
+           "in staging", "for the new client", "and add metrics", "", ""]
+PRIORITIES = ["High", "Medium", "Medium", "Low"]
+STATUSES = ["To-Do", "To-Do", "In Progress", "Done", "Done"]
+
+
+def lead_username(team):
+    return f"lead{team}"
+
+
+def member_username(team, i):
+    return f"m{team}_{i}"
+
+
+def generate(conn, teams=10, members=5, tasks=500, submissions=100, seed=1, start=None):
+    """Fill ``conn`` (already migrated) and return row counts.
+
+    ``tasks`` and ``submissions`` are per team; created_at dates are spread
+    over the 180 days before ``start`` (default: 2025-01-01).
+    """
+    rng = random.Random(seed)
+    start = start or datetime(2025, 1, 1)
+    counts = {"teams": 0, "users": 0, "tasks": 0, "submissions": 0}
+    conn.execute("BEGIN")
+    for t in range(1, teams + 1):
+        lead_id = conn.execute("INSERT INTO users (username, display_name, password, role) VALUES (?, ?, ?, 'lead')",
+                               (lead_username(t), f"Lead {t}", PASSWORD)).lastrowid
+        team_code = f"BENCH{t:04d}"
+        team_id = conn.execute("INSERT INTO teams (team_code, lead_id, member_count) VALUES (?, ?, ?)",
+                               (team_code, lead_id, members)).lastrowid
+        member_ids = []
+        for i in range(1, members + 1):
+            member_ids.append(conn.execute(
+                "INSERT INTO users (username, display_name, password, role, team_id, member_code) "
+                "VALUES (?, ?, ?, 'member', ?, ?)",
+                (member_username(t, i), f"Member {t}.{i}", PASSWORD, team_id, f"{team_code}-{i:02d}")).lastrowid)
+        conn.executemany("INSERT INTO member_codes (code, team_id, claimed_by, claimed_at) VALUES (?, ?, ?, ?)",
+                         [(f"{team_code}-{i:02d}", team_id, member_id, start.strftime("%Y-%m-%d %H:%M:%S"))
+                          for i, member_id in enumerate(member_ids, 1)])
+        rows = []
+        for _ in range(tasks):
+            text = " ".join(filter(None, [rng.choice(VERBS), rng.choice(OBJECTS), rng.choice(DETAILS)]))
+            created = start - timedelta(minutes=rng.randrange(180 * 24 * 60))
+            rows.append((text, str(rng.choice(member_ids)), rng.choice(PRIORITIES), rng.choice(STATUSES),
+                         created.strftime("%Y-%m-%d %H:%M:%S"), team_id))
+        # oldest first, so ids grow with created_at as they do in real use
+        rows.sort(key=lambda r: r[4])
+        conn.executemany("INSERT INTO tasks (task, assigned_to, priority, status, created_at, team_id) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        task_ids = [r[0] for r in conn.execute("SELECT id FROM tasks WHERE team_id=?", (team_id,))]
+        subs = []
+        for _ in range(submissions if task_ids else 0):
+            task_id = rng.choice(task_ids)
+            subs.append((task_id, rng.choice(member_ids), f"https://github.com/example/repo/pull/{rng.randrange(1, 10**5)}",
+                         (start - timedelta(minutes=rng.randrange(90 * 24 * 60))).strftime("%Y-%m-%d %H:%M:%S"),
+                         team_id))
+        conn.executemany("INSERT INTO submissions (task_id, member_id, github_link, submitted_on, team_id) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         subs)
+        counts["teams"] += 1
+        counts["users"] += members + 1
+        counts["tasks"] += len(rows)
+        counts["submissions"] += len(subs)
+    conn.commit()
+    return counts
@@ -0,0 +1,217 @@
+"""Load driver: virtual leads and members replaying a weighted route mix.
+
+Each worker thread logs in as one user of a random team and then picks
+routes by weight until the run ends. Requests go through Flask's test
+client, or over real HTTP when a base URL is given (cookies are kept per
+worker in both cases). RSS is sampled in this process, so it describes the
+app only with the test client.
+"""
+import http.client
+import http.cookiejar
+import json
+import os
+import random
+import resource
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from bench.datagen import PASSWORD, lead_username, member_username
+
+# (route label, weight, action). Labels are Flask endpoint names, suffixed for variants.
+LEAD_MIX = [
+    ("lead_dashboard", 30, lambda u: u.get("/lead/dashboard")),
+    ("lead_dashboard_older", 5, lambda u: u.get(f"/lead/dashboard?before={u.random_task()}")),
+    ("task_list", 15, lambda u: u.get("/task-list?status=" + u.random_status())),
+    ("delay_prediction_shared", 10, lambda u: u.get("/delay-prediction")),
+    ("export_csv_lead", 2, lambda u: u.get("/export-csv")),
+    ("add_task", 5, lambda u: u.post("/add-task", {"task": f"bench task {u.rng.randrange(10**6)}",
+                                                   "assigned_to": u.random_member(), "priority": "Medium"})),
+    ("update_status_lead", 5, lambda u: u.get(f"/update-status/{u.random_task()}/{u.random_status()}")),
+    ("delete_task_lead", 1, lambda u: u.get(f"/delete-task/{u.random_task()}")),
+]
+MEMBER_MIX = [
+    ("member_dashboard", 30, lambda u: u.get("/member/dashboard")),
+    ("task_list", 10, lambda u: u.get("/task-list")),
+    ("delay_prediction_shared", 5, lambda u: u.get("/delay-prediction")),
+    ("member_mark_done", 3, lambda u: u.get(f"/member-mark-done/{u.random_task()}")),
+    ("submit_github", 4, lambda u: u.post(f"/submit/{u.own_task()}",
+                                          {"github_link": f"https://github.com/example/pr/{u.rng.randrange(10**5)}"})),
+]
+
+
+def current_rss_kb():
+    """Resident set size now, falling back to the peak where /proc is missing."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class TestClientTransport:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        for _ in response.response:  # drain streamed bodies (exports) like a browser would
+            pass
+        response.close()
+        return response.status_code
+
+    def get_json(self, path):
+        return self.client.get(path).get_json()
+
+
+class HTTPTransport:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+                                                  _NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                while response.read(1 << 16):
+                    pass
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except (OSError, http.client.HTTPException):
+            return 599  # connection-level failure, counted as an error
+
+    def get_json(self, path):
+        with self.opener.open(self.base_url + path, timeout=60) as response:
+            return json.load(response)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # write routes answer with a redirect; measure them alone, like the test client does
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class VirtualUser:
+    def __init__(self, transport, rng, role, team, members, tasks_per_team):
+        self.transport = transport
+        self.rng = rng
+        self.role = role
+        self.team = team
+        self.members = members
+        self.tasks_per_team = tasks_per_team
+        self.own_tasks = []
+
+    def login(self):
+        if self.role == "lead":
+            return self.post("/lead-login", {"username": lead_username(self.team), "password": PASSWORD})
+        member = self.rng.randrange(1, self.members + 1)
+        status = self.post("/member-login", {"username": member_username(self.team, member), "password": PASSWORD})
+        # members may only submit links for their own tasks
+        user_id = (self.team - 1) * (self.members + 1) + 1 + member
+        page = self.transport.get_json(f"/api/v1/tasks?assigned_to={user_id}&limit=200")
+        self.own_tasks = [t["id"] for t in page["tasks"]]
+        return status
+
+    def get(self, path):
+        return self.transport.request("GET", path)
+
+    def post(self, path, data):
+        return self.transport.request("POST", path, data)
+
+    def random_task(self):
+        # a fresh datagen database holds each team's tasks as one contiguous id range
+        return (self.team - 1) * self.tasks_per_team + 1 + self.rng.randrange(max(self.tasks_per_team, 1))
+
+    def own_task(self):
+        return self.rng.choice(self.own_tasks) if self.own_tasks else self.random_task()
+
+    def random_status(self):
+        return urllib.parse.quote(self.rng.choice(["To-Do", "In Progress", "Done"]))
+
+    def random_member(self):
+        # member user ids follow their lead's: lead, m1..mN for every team
+        return str((self.team - 1) * (self.members + 1) + 1 + self.rng.randrange(1, self.members + 1))
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.peak_rss_kb = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, seconds, status, rss_kb):
+        with self._lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if status >= 400:
+                self.errors[route] = self.errors.get(route, 0) + 1
+            self.peak_rss_kb[route] = max(self.peak_rss_kb.get(route, 0), rss_kb)
+
+
+def run(app=None, base_url=None, teams=10, members=5, tasks_per_team=500, duration=10.0, requests=None,
+        concurrency=4, member_share=0.6, seed=1, warmup=20):
+    """Replay the route mix and return (Recorder, wall seconds).
+
+    Stops after ``duration`` seconds, or after ``requests`` in total when
+    given. ``warmup`` requests per worker are made first and not recorded.
+    """
+    recorder = Recorder()
+    deadline_lock = threading.Lock()
+    budget = {"left": requests}
+
+    def take():
+        if budget["left"] is None:
+            return True
+        with deadline_lock:
+            if budget["left"] <= 0:
+                return False
+            budget["left"] -= 1
+            return True
+
+    def worker(n, start_barrier, stop_at):
+        try:
+            replay(n, start_barrier, stop_at)
+        except threading.BrokenBarrierError:
+            pass
+        except Exception:
+            start_barrier.abort()  # don't leave the other workers waiting for this one
+            raise
+
+    def replay(n, start_barrier, stop_at):
+        rng = random.Random(seed * 1000 + n)
+        transport = HTTPTransport(base_url) if base_url else TestClientTransport(app)
+        role = "member" if rng.random() < member_share else "lead"
+        user = VirtualUser(transport, rng, role, rng.randrange(1, teams + 1), members, tasks_per_team)
+        user.login()
+        mix = MEMBER_MIX if role == "member" else LEAD_MIX
+        labels = [m[0] for m in mix]
+        weights = [m[1] for m in mix]
+        actions = {m[0]: m[2] for m in mix}
+        for _ in range(warmup):
+            actions[rng.choices(labels, weights)[0]](user)
+        start_barrier.wait()
+        while time.monotonic() < stop_at[0] and take():
+            label = rng.choices(labels, weights)[0]
+            t0 = time.perf_counter()
+            status = actions[label](user)
+            recorder.add(label, time.perf_counter() - t0, status, current_rss_kb())
+
+    stop_at = [float("inf")]
+    barrier = threading.Barrier(concurrency + 1)
+    threads = [threading.Thread(target=worker, args=(n, barrier, stop_at), daemon=True) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        raise RuntimeError("a benchmark worker failed before the run started")
+    started = time.perf_counter()
+    stop_at[0] = time.monotonic() + duration if requests is None else float("inf")
+    for t in threads:
+        t.join()
+    return recorder, time.perf_counter() - started
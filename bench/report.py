@@ -0,0 +1,89 @@
+"""Turn recorded samples into a JSON report and compare two reports."""
+import json
+import platform
+import sqlite3
+import subprocess
+from datetime import datetime, timezone
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(recorder, wall_seconds, params):
+    routes = {}
+    total = 0
+    for route, samples in sorted(recorder.samples.items()):
+        ms = sorted(s * 1000 for s in samples)
+        total += len(ms)
+        routes[route] = {
+            "count": len(ms),
+            "errors": recorder.errors.get(route, 0),
+            "p50_ms": round(percentile(ms, 50), 3),
+            "p95_ms": round(percentile(ms, 95), 3),
+            "p99_ms": round(percentile(ms, 99), 3),
+            "mean_ms": round(sum(ms) / len(ms), 3),
+            "throughput_rps": round(len(ms) / wall_seconds, 2) if wall_seconds else 0.0,
+            "peak_rss_mb": round(recorder.peak_rss_kb.get(route, 0) / 1024, 1),
+        }
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "params": params,
+        "wall_seconds": round(wall_seconds, 3),
+        "requests": total,
+        "throughput_rps": round(total / wall_seconds, 2) if wall_seconds else 0.0,
+        "peak_rss_mb": max((r["peak_rss_mb"] for r in routes.values()), default=0.0),
+        "routes": routes,
+    }
+
+
+def format_table(report):
+    lines = [f"{'route':<26}{'count':>7}{'err':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'rps':>9}{'rss MB':>9}"]
+    for route, r in report["routes"].items():
+        lines.append(f"{route:<26}{r['count']:>7}{r['errors']:>5}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+                     f"{r['p99_ms']:>9.2f}{r['throughput_rps']:>9.1f}{r['peak_rss_mb']:>9.1f}")
+    lines.append(f"total {report['requests']} requests in {report['wall_seconds']}s = "
+                 f"{report['throughput_rps']} req/s, peak RSS {report['peak_rss_mb']} MB")
+    return "\n".join(lines)
+
+
+def compare(old, new):
+    """Per-route p50/p95/p99 and throughput change from ``old`` to ``new``, as text."""
+    def delta(a, b):
+        return f"{b:9.2f} ({(b - a) / a * 100:+6.1f}%)" if a else f"{b:9.2f}"
+
+    lines = [f"{old.get('commit')} -> {new.get('commit')}",
+             f"{'route':<26}{'p50 ms':>20}{'p95 ms':>20}{'p99 ms':>20}{'rps':>20}"]
+    for route in sorted(set(old["routes"]) | set(new["routes"])):
+        a, b = old["routes"].get(route), new["routes"].get(route)
+        if not a or not b:
+            lines.append(f"{route:<26} only in {'new' if b else 'old'} run")
+            continue
+        lines.append(f"{route:<26}" + "".join(f"{delta(a[k], b[k]):>20}"
+                                              for k in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")))
+    return "\n".join(lines)
+
+
+def save(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,96 @@
+"""Cold-start benchmark: import, init_app() and first request in fresh interpreters.
+
+Every sample is a new ``python`` process, as a freshly forked or restarted
+worker would be. The first process runs against an unmigrated database and
+is reported separately as ``first_boot``; the rest measure a restart against
+an up-to-date schema.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = ("import_ms", "init_app_ms", "first_request_ms")
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+flask_app = app.init_app()
+t2 = time.perf_counter()
+flask_app.test_client().get("/")
+t3 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "init_app_ms": (t2 - t1) * 1000,
+                  "first_request_ms": (t3 - t2) * 1000, "modules": len(sys.modules)}))
+"""
+
+
+def _child(db_path, extra_args=()):
+    env = dict(os.environ, DATABASE_URL=db_path)
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, *extra_args, "-c", CHILD], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+    sample = json.loads(proc.stdout.strip().splitlines()[-1])
+    sample["process_ms"] = (time.perf_counter() - start) * 1000
+    return sample, proc.stderr
+
+
+def measure(db_path, repeat=5):
+    """Return (first boot sample, [restart samples])."""
+    first, _ = _child(db_path)
+    return first, [_child(db_path)[0] for _ in range(repeat)]
+
+
+def slowest_imports(db_path, top=10):
+    """[(cumulative ms, module)] of the slowest top-level imports under ``import app``."""
+    _, stderr = _child(db_path, ("-X", "importtime"))
+    # -X importtime logs a module after everything it imported, indented two
+    # more spaces per level, so app's direct imports are the depth-1 lines
+    # right before the top-level "app" line
+    rows, pending = [], []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == "app":
+                rows = pending
+                break
+            pending = []
+        elif depth == 1:
+            pending.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def summarize(first, samples, budget_ms):
+    def median(key):
+        return round(statistics.median(s[key] for s in samples), 1)
+
+    startup = median("import_ms") + median("init_app_ms")
+    return {
+        "first_boot": {k: round(v, 1) for k, v in first.items()},
+        "restart": {k: median(k) for k in PHASES + ("process_ms", "modules")},
+        "samples": len(samples),
+        "startup_ms": round(startup, 1),
+        "budget_ms": budget_ms,
+        "within_budget": startup <= budget_ms,
+    }
+
+
+def format_result(result, imports=()):
+    r, f = result["restart"], result["first_boot"]
+    lines = [f"{'':<14}{'import':>10}{'init_app':>12}{'1st request':>13}{'process':>10}{'modules':>9}"]
+    for label, row in (("first boot", f), ("restart (p50)", r)):
+        lines.append(f"{label:<14}{row['import_ms']:>10.1f}{row['init_app_ms']:>12.1f}"
+                     f"{row['first_request_ms']:>13.1f}{row['process_ms']:>10.1f}{row['modules']:>9}")
+    verdict = "within" if result["within_budget"] else "OVER"
+    lines.append(f"startup (import + init_app) {result['startup_ms']} ms, {verdict} the {result['budget_ms']} ms budget")
+    if imports:
+        lines.append("slowest imports:")
+        lines += [f"  {ms:8.1f} ms  {name}" for ms, name in imports]
+    return "\n".join(lines)
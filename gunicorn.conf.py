@@ -0,0 +1,24 @@
+"""Gunicorn settings: ``gunicorn -c gunicorn.conf.py``.
+
+Migrations run once in the master before any worker is forked; workers
+inherit the already-imported app, so each one starts serving without
+re-importing Flask or touching the schema.
+"""
+import os
+
+wsgi_app = "app:init_app()"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# app.py reads GUNICORN_THREADS too: every open /events stream holds one of
+# these threads, so it caps streams per worker below this (EVENT_MAX_STREAMS)
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+worker_class = "gthread"
+timeout = 60
+
+
+def on_starting(server):
+    import app
+
+    app.ensure_schema()
+    # don't hand the master's SQLite connections to the forked workers
+    app.db_pool.close_all()